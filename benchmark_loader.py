@@ -0,0 +1,199 @@
+# Benchmark pyMCDS_cells on frames of increasing size: construction, reading
+# the cells, the mesh and the microenvironment, get_cell_df, voxel lookup and
+# concentration queries, reporting the wall time of each and the peak
+# resident memory. Loading is lazy and .mat files are memory-mapped, so every
+# load stage reads all of its data, otherwise it would be paid for, unseen,
+# by whichever stage touches it first.
+#
+#   python benchmark_loader.py                        # 23k, 116k, 1M, 5M cells
+#   python benchmark_loader.py --sizes 1000000 --repeat 5 --json bench.json
+#
+# The real frames data/output00000001.xml (23k cells) and
+# data/output00000246.xml (116k cells) are used when their .mat files are
+# present. Synthetic frames, written by make_synthetic_frames.py into
+# --data-dir, are used for every other size and are only generated once.
+# Every case runs in a fresh process so peak memory is measured per case
+# and nothing is shared through the page cache of an earlier case in the
+# same interpreter.
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+_REAL_FRAMES = [('data', 'output00000001.xml'), ('data', 'output00000246.xml')]
+_DEFAULT_SIZES = [23123, 116038, 1000000, 5000000]
+_STAGES = ['construct', 'load_cells', 'load_mesh', 'load_microenv', 'get_cell_df',
+           'voxel_lookup', 'concentrations']
+
+
+def _peak_rss_mb():
+    # ru_maxrss carries over the peak of the parent process across exec on
+    # Linux, the high water mark in /proc starts afresh with the new image
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2 ** 10
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == 'darwin':
+        return peak / 2 ** 20
+    return peak / 2 ** 10
+
+
+def _read_all(arrays):
+    # summing reads every page of a memory-mapped array
+    for array in arrays:
+        np.sum(array)
+
+
+def run_case(output_path, xml_file):
+    """
+    Runs every benchmark stage once on a single frame, in this process.
+
+    Returns
+    -------
+    result : dict
+        'n_cells', and for each stage the wall time in seconds and the peak
+        resident memory in MB reached by the end of it
+    """
+    from pyMCDS_cells import pyMCDS_cells
+
+    warnings.simplefilter('ignore')
+    result = {'seconds': {}, 'peak_rss_mb': {}}
+
+    def stage(name, func):
+        start = time.perf_counter()
+        value = func()
+        result['seconds'][name] = time.perf_counter() - start
+        result['peak_rss_mb'][name] = _peak_rss_mb()
+        return value
+
+    mcds = stage('construct', lambda: pyMCDS_cells(xml_file, output_path, microenv=True))
+
+    def load_cells():
+        cells = mcds.data['discrete_cells']
+        _read_all(cells[name] for name in cells)
+        return mcds.get_cell_positions()
+    xyz = stage('load_cells', load_cells)
+
+    def load_mesh():
+        voxels = mcds.data['mesh']['voxels']
+        _read_all([voxels['centers'], voxels['volumes']])
+    stage('load_mesh', load_mesh)
+
+    def load_microenv():
+        variables = mcds.data['continuum_variables']
+        _read_all(variable['data'] for variable in variables.values())
+    stage('load_microenv', load_microenv)
+
+    cells_df = stage('get_cell_df', mcds.get_cell_df)
+    result['n_cells'] = len(cells_df)
+    stage('voxel_lookup', lambda: mcds.get_containing_voxel_ijk_many(xyz))
+
+    def concentrations():
+        species = mcds.get_substrate_names()[0]
+        zz = mcds.get_mesh()[2]
+        mcds.get_concentrations(species, z_slice=zz[0, 0, zz.shape[2] // 2])
+        return mcds.get_concentrations_at_many(xyz)
+    stage('concentrations', concentrations)
+    return result
+
+
+def _run_in_subprocess(output_path, xml_file):
+    out = subprocess.run([sys.executable, __file__, '--child',
+                          str(Path(output_path).resolve()), xml_file],
+                         check=True, stdout=subprocess.PIPE, universal_newlines=True,
+                         cwd=str(Path(__file__).parent))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _find_cases(sizes, real_dir, data_dir):
+    from pyMCDS_cells import read_frame_info
+    from make_synthetic_frames import write_synthetic_frame
+
+    cases = []
+    real_counts = set()
+    for _, xml_file in _REAL_FRAMES:
+        try:
+            info = read_frame_info(xml_file, real_dir)
+        except (OSError, ValueError):
+            continue
+        cases.append(('{}/{}'.format(real_dir, xml_file), Path(real_dir), xml_file))
+        real_counts.add(info['n_cells'])
+
+    for n_cells in sizes:
+        if n_cells in real_counts:
+            continue
+        frame_dir = Path(data_dir) / 'cells_{}'.format(n_cells)
+        try:
+            have = read_frame_info('output00000000.xml', frame_dir)['n_cells'] == n_cells
+        except (OSError, ValueError):
+            have = False
+        if not have:
+            print('Generating a synthetic frame with {} cells in {}'.format(
+                n_cells, frame_dir), file=sys.stderr)
+            write_synthetic_frame(frame_dir, n_cells)
+        cases.append(('synthetic {}'.format(n_cells), frame_dir, 'output00000000.xml'))
+    return cases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark pyMCDS_cells loading and queries on frames of '
+                    'increasing size.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=_DEFAULT_SIZES,
+                        help='cell counts of the frames to benchmark, real frames '
+                             'are used where available (default: 23123 116038 '
+                             '1000000 5000000)')
+    parser.add_argument('--real-dir', default='data',
+                        help='directory with the real output frames (default: data)')
+    parser.add_argument('--data-dir', default='bench_data',
+                        help='directory for the synthetic frames (default: bench_data)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per case, the fastest is reported (default: 3)')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--child', nargs=2, metavar=('OUTPUT_PATH', 'XML_FILE'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_case(*args.child)))
+        return 0
+
+    results = []
+    for name, output_path, xml_file in _find_cases(args.sizes, args.real_dir, args.data_dir):
+        runs = [_run_in_subprocess(output_path, xml_file) for _ in range(max(1, args.repeat))]
+        results.append({
+            'case': name,
+            'n_cells': runs[0]['n_cells'],
+            'seconds': {s: min(run['seconds'][s] for run in runs) for s in _STAGES},
+            'peak_rss_mb': max(run['peak_rss_mb'][_STAGES[-1]] for run in runs),
+        })
+
+    header = '{:<28} {:>9} '.format('case', 'cells') \
+        + ' '.join('{:>14}'.format(s) for s in _STAGES) + ' {:>12}'.format('peak RSS MB')
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        print('{:<28} {:>9} '.format(result['case'], result['n_cells'])
+              + ' '.join('{:>13.4f}s'.format(result['seconds'][s]) for s in _STAGES)
+              + ' {:>12.1f}'.format(result['peak_rss_mb']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+# Rule based coloring of PhysiCell cells, shared by the viewers.
+#
+# A color scheme is a list of (condition, color) rules applied in order, a
+# later rule overriding the earlier ones for the cells it matches, which is
+# how the per-cell if/elif chains of the viewers read. Conditions and colors
+# are evaluated on whole columns at once, so coloring 100k+ cells takes a
+# few NumPy operations instead of a Python loop.
+#
+#   rgb = colorize(mcds.data['discrete_cells'], ONCOPROTEIN_SCHEME)
+
+import operator
+
+import numpy as np
+
+YELLOW = (1., 1., 0.)
+RED = (1., 0., 0.)
+BLACK = (0., 0., 0.)
+BROWN = (0.54, 0.27, 0.075)  # 139./255, 69./255, 19./255
+
+_OPS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': np.isin,
+}
+
+
+class Ramp:
+    """
+    Linear color ramp over a cell variable: start at vmin, end at vmax.
+
+    Parameters
+    ----------
+    column : str
+        Cell variable the ramp is driven by, e.g. 'oncoprotein'
+    start, end : tuple (float)
+        RGB colors at vmin and vmax
+    vmin, vmax : float, optional
+        Range of the ramp, default to the min and max of the column over all
+        cells, not only over the cells the rule applies to
+    """
+    def __init__(self, column, start, end, vmin=None, vmax=None):
+        self.column = column
+        self.start = tuple(float(c) for c in start)
+        self.end = tuple(float(c) for c in end)
+        self.vmin = vmin
+        self.vmax = vmax
+
+    def get_range(self, cells):
+        """
+        Returns the (vmin, vmax) the ramp uses for these cells.
+        """
+        values = cells[self.column]
+        vmin = values.min() if self.vmin is None else self.vmin
+        vmax = values.max() if self.vmax is None else self.vmax
+        return vmin, vmax
+
+    def evaluate(self, cells, mask):
+        vmin, vmax = self.get_range(cells)
+        t = (cells[self.column][mask] - vmin) / (vmax - vmin)
+        return [s + t * (e - s) if e != s else s
+                for s, e in zip(self.start, self.end)]
+
+
+class Palette:
+    """
+    Categorical colors looked up by the value of a cell variable.
+
+    Parameters
+    ----------
+    column : str
+        Cell variable to look up, e.g. 'cell_type'
+    colors : dict
+        RGB color for each value. Cells whose value is not in colors keep the
+        color they already had.
+    """
+    def __init__(self, column, colors):
+        self.column = column
+        self.values = np.array(sorted(colors), dtype=float)
+        self.table = np.array([colors[value] for value in sorted(colors)], dtype=float)
+
+    def evaluate(self, cells, mask):
+        values = cells[self.column][mask]
+        pos = np.clip(np.searchsorted(self.values, values), 0, self.values.shape[0] - 1)
+        found = self.values[pos] == values
+        return pos, found
+
+
+# the live/apoptotic/necrotic coloring of tumor_vis2.py and the billboard
+# viewers, live cells shaded from yellow to black by oncoprotein
+ONCOPROTEIN_SCHEME = [
+    (None, YELLOW),
+    (('cell_type', '==', 1), YELLOW),
+    (('cycle_model', '<', 100), Ramp('oncoprotein', YELLOW, BLACK)),
+    (('cycle_model', '==', 100), RED),
+    (('cycle_model', '>', 100), BROWN),
+]
+
+# the same without the oncoprotein shading, for output that does not have it
+LIVE_DEAD_SCHEME = [
+    (None, YELLOW),
+    (('cell_type', '==', 1), YELLOW),
+    (('cycle_model', '<', 100), YELLOW),
+    (('cycle_model', '==', 100), RED),
+    (('cycle_model', '>', 100), BROWN),
+]
+
+
+def cell_type_scheme(colors, default=YELLOW):
+    """
+    Returns a scheme coloring cells by cell_type.
+
+    Parameters
+    ----------
+    colors : dict
+        RGB color for each cell type
+    default : tuple (float), optional
+        Color of the cell types missing from colors (default= YELLOW)
+    """
+    return [(None, default), (None, Palette('cell_type', colors))]
+
+
+def get_columns(scheme):
+    """
+    Returns the cell variables a scheme needs, e.g. to pass as the columns
+    argument of pyMCDS_cells.
+    """
+    columns = []
+    for condition, color in scheme:
+        names = [condition[0]] if condition is not None else []
+        if isinstance(color, (Ramp, Palette)):
+            names.append(color.column)
+        columns += [name for name in names if name not in columns]
+    return columns
+
+
+def colorize(cells, scheme, alpha=None):
+    """
+    Evaluates a color scheme for every cell.
+
+    Parameters
+    ----------
+    cells : dict
+        Cell variables, e.g. mcds.data['discrete_cells']
+    scheme : list
+        (condition, color) rules, applied in order. condition is None (all
+        cells) or (column, op, value) with op one of <, <=, ==, !=, >, >=
+        and in. color is an RGB tuple, a Ramp or a Palette.
+    alpha : float, optional
+        If given, an alpha channel with this value is added
+
+    Returns
+    -------
+    colors : array (np.float) shape=[n_cells, 3] or [n_cells, 4]
+    """
+    n_cells = None
+    for name in get_columns(scheme):
+        n_cells = len(cells[name])
+        break
+    if n_cells is None:
+        n_cells = len(cells['ID'])
+
+    rgb = np.zeros((n_cells, 3 if alpha is None else 4))
+    if alpha is not None:
+        rgb[:, 3] = alpha
+
+    for condition, color in scheme:
+        if condition is None:
+            mask = slice(None)
+        else:
+            column, op, value = condition
+            mask = _OPS[op](cells[column], value)
+
+        if isinstance(color, Palette):
+            pos, found = color.evaluate(cells, mask)
+            idx = np.arange(n_cells)[mask][found]
+            rgb[idx, :3] = color.table[pos[found]]
+        elif isinstance(color, Ramp):
+            for channel, values in enumerate(color.evaluate(cells, mask)):
+                rgb[mask, channel] = values
+        else:
+            rgb[mask, :3] = color
+    return rgb
+
+
+def _glsl_float(value):
+    return repr(float(value))
+
+
+def _glsl_vec3(color):
+    return 'vec3({})'.format(', '.join(_glsl_float(c) for c in color))
+
+
+def glsl_color_function(schemes, attributes, name='cellColor'):
+    """
+    Translates color schemes into a GLSL function, so cells can be colored in
+    the fragment shader from their raw cell variables. Switching between the
+    schemes, or changing the range of a Ramp, is then a uniform update.
+
+    Parameters
+    ----------
+    schemes : list
+        Color schemes, the int uniform <name>Scheme selects one by index
+    attributes : list (str)
+        Cell variables packed, in this order, into the float/vecN argument
+        of the function, at most 4
+    name : str, optional
+        Name of the function (default= 'cellColor')
+
+    Returns
+    -------
+    code : str
+        Declarations of the uniforms and of vec3 <name>(vecN attr), for the
+        fragment shader declarations
+    ramps : list (Ramp)
+        The ramps of all schemes, in order. The range of ramp i is the vec2
+        uniform <name>Range<i>, see get_ramp_ranges.
+    """
+    if not 1 <= len(attributes) <= 4:
+        raise ValueError('Between 1 and 4 cell attributes can be passed to the shader')
+    arg_type = ['float', 'vec2', 'vec3', 'vec4'][len(attributes) - 1]
+
+    def component(column):
+        if column not in attributes:
+            raise ValueError('{} is used by a color scheme but is not one of the '
+                             'shader attributes {}'.format(column, attributes))
+        if len(attributes) == 1:
+            return 'attr'
+        return 'attr.' + 'xyzw'[attributes.index(column)]
+
+    ramps = []
+    lines = ['uniform int {}Scheme;'.format(name)]
+    body = []
+    for s, scheme in enumerate(schemes):
+        body.append('    {}if ({}Scheme == {}) {{'.format('else ' if s else '', name, s))
+        for condition, color in scheme:
+            test = None
+            if condition is not None:
+                column, op, value = condition
+                if op == 'in':
+                    test = ' || '.join('{} == {}'.format(component(column), _glsl_float(v))
+                                       for v in value)
+                    test = '({})'.format(test or 'false')
+                else:
+                    test = '{} {} {}'.format(component(column), op, _glsl_float(value))
+
+            if isinstance(color, Ramp):
+                uniform = '{}Range{}'.format(name, len(ramps))
+                ramps.append(color)
+                lines.append('uniform vec2 {};'.format(uniform))
+                value = component(color.column)
+                statements = [
+                    'float t = ({0} - {1}.x) / max({1}.y - {1}.x, 1e-30);'.format(value, uniform),
+                    'rgb = mix({}, {}, t);'.format(_glsl_vec3(color.start), _glsl_vec3(color.end))]
+            elif isinstance(color, Palette):
+                value = component(color.column)
+                statements = ['{}if ({} == {}) rgb = {};'.format(
+                    'else ' if i else '', value, _glsl_float(v), _glsl_vec3(rgb))
+                    for i, (v, rgb) in enumerate(zip(color.values, color.table))]
+            else:
+                statements = ['rgb = {};'.format(_glsl_vec3(color))]
+
+            if test is None:
+                body += ['        ' + st for st in statements]
+            else:
+                body.append('        if ({}) {{'.format(test))
+                body += ['            ' + st for st in statements]
+                body.append('        }')
+        body.append('    }')
+
+    lines.append('vec3 {}({} attr)'.format(name, arg_type))
+    lines.append('{')
+    lines.append('    vec3 rgb = vec3(0.);')
+    lines += body
+    lines.append('    return rgb;')
+    lines.append('}')
+    return '\n'.join(lines) + '\n', ramps
+
+
+def get_ramp_ranges(ramps, cells):
+    """
+    Returns the (vmin, vmax) of each ramp for these cells, the values of the
+    range uniforms of glsl_color_function.
+    """
+    return [tuple(float(v) for v in ramp.get_range(cells)) for ramp in ramps]
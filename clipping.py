@@ -0,0 +1,123 @@
+# Clip sphere actors on the GPU. Every vertex carries the center of the
+# sphere it belongs to, and the fragment shader discards the spheres whose
+# center lies outside the X/Y/Z ranges, which are uniforms. Moving a
+# clipping slider only changes the uniforms, the vertex buffers are never
+# touched, whatever the number of cells.
+#
+#   clip = AxisClipping(low_ranges, high_ranges)
+#   clip.attach(spheres_actor, xyz)
+#   slider_x.on_change = lambda slider: clip.set_range(0, *slider._values)
+
+from fury.shaders import attribute_to_actor, shader_to_actor
+
+import numpy as np
+import vtk
+
+_PASS_CENTER_DEC = \
+    """
+    in vec3 cellCenter;
+    out vec3 cellCenterVSOutput;
+    """
+_PASS_CENTER_IMPL = \
+    """
+    cellCenterVSOutput = cellCenter;
+    """
+_RANGE_CENTERS = \
+    """
+    in vec3 cellCenterVSOutput;
+    uniform vec3 lowRanges;
+    uniform vec3 highRanges;
+
+    bool isVisible(vec3 center)
+    {{
+        bool xValidation = lowRanges.x <= center.x && center.x <= highRanges.x;
+        bool yValidation = lowRanges.y <= center.y && center.y <= highRanges.y;
+        bool zValidation = lowRanges.z <= center.z && center.z <= highRanges.z;
+        return xValidation {0} yValidation {0} zValidation;
+    }}
+    """
+_DISCARD_CLIPPED = \
+    """
+    if(!isVisible(cellCenterVSOutput))
+        discard;
+    """
+
+
+def add_center_attribute(sphere_actor, centers):
+    """
+    Passes the center of its sphere with every vertex of a sphere actor, as
+    the vec3 cellCenterVSOutput of the fragment shader.
+
+    Parameters
+    ----------
+    sphere_actor : vtkActor
+        Actor with the same number of vertices for each sphere, in the order
+        of centers, e.g. from fury.actor.sphere
+    centers : array (np.float) shape=[n_spheres, 3]
+        Centers of the spheres
+    """
+    mapper = sphere_actor.GetMapper()
+    mapper.Update()
+    # spheres made by a glyph filter would lose the attribute whenever the
+    # filter runs again, the mapper is given a static copy of its output
+    polydata = vtk.vtkPolyData()
+    polydata.ShallowCopy(mapper.GetInput())
+    mapper.SetInputData(polydata)
+
+    n_points = polydata.GetNumberOfPoints()
+    if centers.shape[0] == 0 or n_points % centers.shape[0]:
+        raise ValueError('The actor has {} vertices, which is not the same number '
+                         'for each of the {} spheres'.format(n_points, centers.shape[0]))
+    verts_per_sph = n_points // centers.shape[0]
+    attribute_to_actor(sphere_actor,
+                       np.repeat(np.asarray(centers, dtype=np.float32), verts_per_sph, axis=0),
+                       'cellCenter')
+    shader_to_actor(sphere_actor, 'vertex', decl_code=_PASS_CENTER_DEC,
+                    impl_code=_PASS_CENTER_IMPL)
+
+
+class AxisClipping:
+    """
+    Axis aligned clipping of sphere actors, evaluated in the fragment shader.
+
+    Parameters
+    ----------
+    low_ranges, high_ranges : array (np.float) shape=[3]
+        Lower and upper bounds of the X, Y and Z ranges
+    combine : str, optional
+        'and' shows the spheres whose center is inside all three ranges,
+        'or' those inside any of them (default= 'and')
+    """
+    def __init__(self, low_ranges, high_ranges, combine='and'):
+        if combine not in ('and', 'or'):
+            raise ValueError("combine must be 'and' or 'or', not {!r}".format(combine))
+        self.low_ranges = np.array(low_ranges, dtype=float)
+        self.high_ranges = np.array(high_ranges, dtype=float)
+        self.combine = combine
+
+    def attach(self, sphere_actor, centers):
+        """
+        Clips a sphere actor, see add_center_attribute for the requirements
+        on the actor.
+        """
+        add_center_attribute(sphere_actor, centers)
+        operator = '&&' if self.combine == 'and' else '||'
+        shader_to_actor(sphere_actor, 'fragment',
+                        decl_code=_RANGE_CENTERS.format(operator),
+                        impl_code=_DISCARD_CLIPPED, block='light')
+        sphere_actor.GetMapper().AddObserver(vtk.vtkCommand.UpdateShaderEvent,
+                                             self._update_shader)
+
+    def set_range(self, axis, low, high):
+        """
+        Sets the range of an axis, 0, 1 or 2 for X, Y or Z. It is used from
+        the next render on.
+        """
+        self.low_ranges[axis] = low
+        self.high_ranges[axis] = high
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def _update_shader(self, caller, event, calldata=None):
+        if calldata is not None:
+            calldata.SetUniform3f('lowRanges', self.low_ranges)
+            calldata.SetUniform3f('highRanges', self.high_ranges)
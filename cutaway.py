@@ -0,0 +1,421 @@
+# Cutaway views of sphere actors. A cut is a region of space built from
+# planes, balls and wedges combined with | (union), & (intersection),
+# - (difference) and ~ (complement). The cells whose center lies inside the
+# cut are discarded in the fragment shader, and the parameters of the
+# shapes are uniforms, so changing a cut, e.g. from the sliders of
+# build_cutaway_panel, never reloads, crops or re-uploads the cells.
+#
+#   center = xyz.mean(axis=0)
+#   # a quarter of the spheroid removed, except for its core
+#   cutaway = Cutaway(Wedge(center, (0, 0, 1), 0, 90) - Ball(center, 150))
+#   cutaway.attach(spheres_actor, xyz)
+#   scene.add(build_cutaway_panel(cutaway, extent=400))
+
+from clipping import add_center_attribute
+from fury import ui
+from fury.shaders import shader_to_actor
+
+import abc
+
+import numpy as np
+import vtk
+
+_CUTAWAY_DEC = \
+    """
+    in vec3 cellCenterVSOutput;
+
+    bool inWedge(vec3 p, vec3 origin, vec3 axis, vec3 ref, vec2 angles)
+    {{
+        vec3 v = p - origin;
+        float angle = atan(dot(cross(ref, v), axis), dot(ref, v));
+        return mod(angle - angles.x, 6.28318530718) <= angles.y;
+    }}
+
+    {uniforms}
+
+    bool inCut(vec3 p)
+    {{
+        return {expression};
+    }}
+    """
+_DISCARD_CUT = \
+    """
+    if(inCut(cellCenterVSOutput))
+        discard;
+    """
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=float)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        raise ValueError('A zero vector has no direction')
+    return vector / norm
+
+
+class Cut(abc.ABC):
+    """
+    Base class of the cut regions. Combine regions with |, &, - and ~.
+    """
+    def __or__(self, other):
+        return Union(self, other)
+
+    def __and__(self, other):
+        return Intersection(self, other)
+
+    def __sub__(self, other):
+        return Intersection(self, Complement(other))
+
+    def __invert__(self):
+        return Complement(self)
+
+    def get_shapes(self):
+        """
+        Returns the shapes the region is built from, in the order of their
+        uniforms.
+        """
+        return [self]
+
+    @abc.abstractmethod
+    def contains(self, points):
+        """
+        Returns which points lie inside the region, the same test as the
+        shader in double precision.
+
+        Parameters
+        ----------
+        points : array (np.float) shape=[n_points, 3]
+
+        Returns
+        -------
+        inside : array (bool) shape=[n_points]
+        """
+
+    @abc.abstractmethod
+    def _glsl(self, names):
+        pass
+
+
+class Plane(Cut):
+    """
+    Half space on the side of a plane the normal points to, i.e. the points p
+    with dot(normal, p) > offset.
+
+    Parameters
+    ----------
+    normal : tuple (float)
+        Normal of the plane, need not be normalized
+    offset : float, optional
+        Signed distance of the plane from the origin along the normal
+        (default= 0.)
+    """
+    def __init__(self, normal, offset=0.):
+        self.normal = _unit(normal)
+        self.offset = float(offset)
+
+    def get_angles(self):
+        """
+        Returns the azimuth and elevation of the normal in degrees.
+        """
+        x, y, z = self.normal
+        return np.degrees(np.arctan2(y, x)), np.degrees(np.arcsin(np.clip(z, -1., 1.)))
+
+    def set_angles(self, azimuth, elevation):
+        """
+        Points the normal by its azimuth (around Z, from X) and elevation
+        (from the XY plane) in degrees.
+        """
+        az, el = np.radians(azimuth), np.radians(elevation)
+        self.normal = np.array([np.cos(el) * np.cos(az), np.cos(el) * np.sin(az), np.sin(el)])
+
+    def contains(self, points):
+        return points @ self.normal > self.offset
+
+    def _declare(self, name):
+        return ['uniform vec4 {};'.format(name)]
+
+    def _glsl(self, names):
+        name = names[id(self)]
+        return '(dot({0}.xyz, p) > {0}.w)'.format(name)
+
+    def _set_uniforms(self, program, name):
+        program.SetUniform4f(name, list(self.normal) + [self.offset])
+
+
+class Ball(Cut):
+    """
+    Ball around a center, e.g. the core of a spheroid.
+
+    Parameters
+    ----------
+    center : tuple (float)
+    radius : float
+    """
+    def __init__(self, center, radius):
+        self.center = np.asarray(center, dtype=float)
+        self.radius = float(radius)
+
+    def contains(self, points):
+        return np.sum((points - self.center) ** 2, axis=1) < self.radius ** 2
+
+    def _declare(self, name):
+        return ['uniform vec4 {};'.format(name)]
+
+    def _glsl(self, names):
+        name = names[id(self)]
+        return '(distance({0}.xyz, p) < {0}.w)'.format(name)
+
+    def _set_uniforms(self, program, name):
+        program.SetUniform4f(name, list(self.center) + [self.radius])
+
+
+class Wedge(Cut):
+    """
+    Wedge around an axis, the points whose angle around the axis lies from
+    start to start + width degrees. Angles are measured counterclockwise,
+    looking down the axis, from a reference direction perpendicular to it:
+    X, unless the axis is closer to X than to Y, then Y.
+
+    Parameters
+    ----------
+    origin : tuple (float)
+        A point of the axis
+    axis : tuple (float)
+        Direction of the axis
+    start : float
+        Angle where the wedge starts, in degrees
+    width : float
+        Opening of the wedge in degrees, 0 to 360
+    """
+    def __init__(self, origin, axis, start, width):
+        self.origin = np.asarray(origin, dtype=float)
+        self.axis = _unit(axis)
+        self.start = float(start)
+        self.width = float(width)
+
+    def get_reference(self):
+        """
+        Returns the direction angles are measured from.
+        """
+        ref = np.eye(3)[0 if abs(self.axis[0]) <= abs(self.axis[1]) else 1]
+        return _unit(ref - (ref @ self.axis) * self.axis)
+
+    def contains(self, points):
+        ref = self.get_reference()
+        v = points - self.origin
+        angle = np.arctan2(np.cross(ref, v) @ self.axis, v @ ref)
+        return np.mod(angle - np.radians(self.start), 2 * np.pi) <= np.radians(self.width)
+
+    def _declare(self, name):
+        return ['uniform vec3 {}Origin;'.format(name),
+                'uniform vec3 {}Axis;'.format(name),
+                'uniform vec3 {}Ref;'.format(name),
+                'uniform vec2 {}Angles;'.format(name)]
+
+    def _glsl(self, names):
+        return 'inWedge(p, {0}Origin, {0}Axis, {0}Ref, {0}Angles)'.format(names[id(self)])
+
+    def _set_uniforms(self, program, name):
+        program.SetUniform3f(name + 'Origin', list(self.origin))
+        program.SetUniform3f(name + 'Axis', list(self.axis))
+        program.SetUniform3f(name + 'Ref', list(self.get_reference()))
+        program.SetUniform2f(name + 'Angles', [np.radians(self.start), np.radians(self.width)])
+
+
+class Union(Cut):
+    """
+    Points inside any of the regions.
+    """
+    _glsl_op = ' || '
+
+    def __init__(self, *cuts):
+        if not cuts:
+            raise ValueError('{} needs at least one region'.format(type(self).__name__))
+        self.cuts = cuts
+
+    def get_shapes(self):
+        shapes = []
+        for cut in self.cuts:
+            shapes += [shape for shape in cut.get_shapes()
+                       if all(shape is not s for s in shapes)]
+        return shapes
+
+    def contains(self, points):
+        return np.logical_or.reduce([cut.contains(points) for cut in self.cuts])
+
+    def _glsl(self, names):
+        return '(' + self._glsl_op.join(cut._glsl(names) for cut in self.cuts) + ')'
+
+
+class Intersection(Union):
+    """
+    Points inside all of the regions.
+    """
+    _glsl_op = ' && '
+
+    def contains(self, points):
+        return np.logical_and.reduce([cut.contains(points) for cut in self.cuts])
+
+
+class Complement(Cut):
+    """
+    Points outside of a region.
+    """
+    def __init__(self, cut):
+        self.cut = cut
+
+    def get_shapes(self):
+        return self.cut.get_shapes()
+
+    def contains(self, points):
+        return ~self.cut.contains(points)
+
+    def _glsl(self, names):
+        return '!' + self.cut._glsl(names)
+
+
+class Cutaway:
+    """
+    Discards the cells of a sphere actor whose center is inside a cut
+    region. The shapes of the region may be changed at any time, e.g.
+    ball.radius = 100., the change is used from the next render on. Their
+    number and how they are combined are fixed once attached.
+
+    Parameters
+    ----------
+    cut : Cut
+        Region to cut away
+    """
+    def __init__(self, cut):
+        self.cut = cut
+        self.shapes = cut.get_shapes()
+        self._names = {id(shape): 'cut{}'.format(i) for i, shape in enumerate(self.shapes)}
+
+    def get_glsl(self):
+        """
+        Returns the declarations of the fragment shader: the uniforms of the
+        shapes and bool inCut(vec3 p).
+        """
+        uniforms = []
+        for shape in self.shapes:
+            uniforms += shape._declare(self._names[id(shape)])
+        return _CUTAWAY_DEC.format(uniforms='\n    '.join(uniforms),
+                                   expression=self.cut._glsl(self._names))
+
+    def attach(self, sphere_actor, centers):
+        """
+        Cuts a sphere actor, see clipping.add_center_attribute for the
+        requirements on the actor. An actor can have a single Cutaway or
+        clipping.AxisClipping.
+        """
+        add_center_attribute(sphere_actor, centers)
+        shader_to_actor(sphere_actor, 'fragment', decl_code=self.get_glsl(),
+                        impl_code=_DISCARD_CUT, block='light')
+        sphere_actor.GetMapper().AddObserver(vtk.vtkCommand.UpdateShaderEvent,
+                                             self._update_shader)
+
+    def visible(self, centers):
+        """
+        Returns which cells are shown, e.g. to count them.
+        """
+        return ~self.cut.contains(np.asarray(centers, dtype=float))
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def _update_shader(self, caller, event, calldata=None):
+        if calldata is not None:
+            for shape in self.shapes:
+                shape._set_uniforms(calldata, self._names[id(shape)])
+
+
+## WIDGETS
+
+def _build_label(text, font_size=14):
+    label = ui.TextBlock2D()
+    label.message = text
+    label.font_size = font_size
+    label.font_family = 'Arial'
+    label.justification = 'left'
+    label.bold = False
+    label.italic = False
+    label.shadow = False
+    label.actor.GetTextProperty().SetBackgroundColor(0, 0, 0)
+    label.actor.GetTextProperty().SetBackgroundOpacity(0.0)
+    label.color = (1, 1, 1)
+    return label
+
+
+def _shape_sliders(shape, name, extent):
+    """
+    Returns (label, initial, min, max, setter) for each slider of a shape.
+    """
+    if isinstance(shape, Plane):
+        def set_azimuth(value):
+            shape.set_angles(value, shape.get_angles()[1])
+
+        def set_elevation(value):
+            shape.set_angles(shape.get_angles()[0], value)
+
+        def set_offset(value):
+            shape.offset = value
+        azimuth, elevation = shape.get_angles()
+        return [(name + ' azimuth', azimuth, -180., 180., set_azimuth),
+                (name + ' elevation', elevation, -90., 90., set_elevation),
+                (name + ' offset', shape.offset, -extent, extent, set_offset)]
+
+    if isinstance(shape, Ball):
+        def set_radius(value):
+            shape.radius = value
+        return [(name + ' radius', shape.radius, 0., extent, set_radius)]
+
+    if isinstance(shape, Wedge):
+        def set_start(value):
+            shape.start = value
+
+        def set_width(value):
+            shape.width = value
+        return [(name + ' start', shape.start, 0., 360., set_start),
+                (name + ' width', shape.width, 0., 360., set_width)]
+    return []
+
+
+def build_cutaway_panel(cutaway, extent, position=(5, 5), font_size=14):
+    """
+    Builds a panel with sliders driving the shapes of a cutaway: azimuth,
+    elevation and offset of the planes, radius of the balls, start and width
+    of the wedges.
+
+    Parameters
+    ----------
+    cutaway : Cutaway
+    extent : float
+        Largest plane offset and ball radius the sliders go to, e.g. the
+        distance from the origin to the farthest cell
+    position : tuple (int), optional
+        Position of the panel in the window (default= (5, 5))
+    font_size : int, optional
+        Font size of the labels (default= 14)
+
+    Returns
+    -------
+    panel : ui.Panel2D
+    """
+    rows = []
+    counts = {}
+    for shape in cutaway.shapes:
+        kind = type(shape).__name__
+        counts[kind] = counts.get(kind, 0) + 1
+        rows += _shape_sliders(shape, '{} {}'.format(kind, counts[kind]), extent)
+
+    height = 40 * max(len(rows), 1) + 20
+    panel = ui.Panel2D((420, height), position=position, color=(1, 1, 1), opacity=.1)
+    for i, (text, initial, min_value, max_value, setter) in enumerate(rows):
+        slider = ui.LineSlider2D(
+            initial_value=np.clip(initial, min_value, max_value),
+            min_value=min_value, max_value=max_value, length=200, line_width=3,
+            outer_radius=8, font_size=font_size, text_template="{value:.0f}")
+        slider.on_change = lambda slider, setter=setter: setter(slider.value)
+
+        y = 1. - (i + 1.) / (len(rows) + .5)
+        panel.add_element(_build_label(text, font_size), (.03, y))
+        panel.add_element(slider, (.42, y))
+    return panel
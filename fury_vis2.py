@@ -1,3 +1,4 @@
+from cell_colors import colorize, cell_type_scheme, YELLOW
 from fury import actor, ui, window
 from pyMCDS_cells import pyMCDS_cells
 from vtk.util import numpy_support
@@ -50,27 +51,25 @@ def change_clipping_plane_z(slider):
 
 
 def update_opacities(verts_per_sph=4):
-    global ind_x, ind_y, ind_z, spheres_actor
-    mapper = spheres_actor.GetMapper()
-    pnt_data = mapper.GetInput().GetPointData()
-    pnt_arrays = pnt_data.GetNumberOfArrays()
-    colors_array = None
-    for i in range(pnt_arrays):
-        if pnt_data.GetArray(i).GetName() == 'colors':
-            colors_array = pnt_data.GetArray(i)
-    spheres_colors = numpy_support.vtk_to_numpy(colors_array)
-    opacities = []
-    vis = [255] * verts_per_sph
-    inv = [0] * verts_per_sph
+    global colors_array, ind_x, ind_y, ind_z, sphere_opacities, spheres_actor, \
+        visible
+    if colors_array is None:
+        pnt_data = spheres_actor.GetMapper().GetInput().GetPointData()
+        colors_array = pnt_data.GetArray('colors')
+        # view of the alpha channel, one row of verts_per_sph vertices per
+        # sphere, so writes go straight into the VTK array
+        spheres_colors = numpy_support.vtk_to_numpy(colors_array)
+        sphere_opacities = spheres_colors.reshape(-1, verts_per_sph, 4)[:, :, 3]
     inds = ind_x | ind_y | ind_z
-    for i, ind in enumerate(inds):
-        if ind:
-            opacities.extend(vis)
-        else:
-            opacities.extend(inv)
-    opacities = np.array(opacities)
-    opacities = np.ascontiguousarray(opacities)
-    spheres_colors[:, 3] = opacities
+    if visible is None:
+        changed = np.arange(inds.shape[0])
+    else:
+        # only the spheres whose visibility changed since the last call
+        changed = np.flatnonzero(inds != visible)
+        if changed.shape[0] == 0:
+            return
+    sphere_opacities[changed] = np.where(inds[changed], 255, 0)[:, np.newaxis]
+    visible = inds
     colors_array.Modified()
 
 
@@ -86,7 +85,9 @@ def win_callback(obj, event):
 
 if __name__ == '__main__':
     # mcds = pyMCDS_cells('output00000001.xml', '.')  # 23123 cells
-    mcds = pyMCDS_cells('output00000003.xml', '.')  
+    mcds = pyMCDS_cells('output00000003.xml', '.',
+                        columns=['ID', 'position', 'total_volume', 'cell_type',
+                                 'cycle_model', 'current_phase'])
     print('time=', mcds.get_time())
 
     print(mcds.data['discrete_cells'].keys())
@@ -117,11 +118,6 @@ if __name__ == '__main__':
 
     np.random.seed(42)
     # rgb = np.random.rand(xyz.shape[0], 3)
-    rgb = np.zeros((ncells,3))
-    # default color: yellow
-    rgb[:,0] = 1
-    rgb[:,1] = 1
-    rgb[:,2] = 0
     cell_phase = mcds.data['discrete_cells']['current_phase']
     # cell_phase = cell_phase[idx_keep]
 
@@ -155,45 +151,9 @@ if __name__ == '__main__':
         cellid_color[id] = color
     # print("cellid_color = ",cellid_color)
 
-    for idx in range(ncells):
-        if cell_type[idx] == 0:
-            rgb[idx,0] = 1
-            rgb[idx,1] = 1
-            rgb[idx,2] = 0
-        else:
-            # print(cellid_color[cell_type[idx]])
-            rgb[idx,0] = cellid_color[cell_type[idx]][0]
-            rgb[idx,1] = cellid_color[cell_type[idx]][1]
-            rgb[idx,2] = cellid_color[cell_type[idx]][2]
-        # elif cell_type[idx] < 10026:
-        #     rgb[idx,0] = color1[0]
-        #     rgb[idx,1] = color1[1]
-        #     rgb[idx,2] = color1[2]
-        # elif cell_type[idx] >= 10026:
-        #     rgb[idx,0] = color2[0]
-        #     rgb[idx,1] = color2[1]
-        #     rgb[idx,2] = color2[2]
-
-        # if cell_type[idx] == 1:
-        #     rgb[idx,0] = 1
-        #     rgb[idx,1] = 1
-        #     rgb[idx,2] = 0
-        #     # self.yval1 = np.array( [(np.count_nonzero((mcds[idx].data['discrete_cells']['cell_type'] == 1) & (mcds[idx].data['discrete_cells']['cycle_model'] < 100) == True)) for idx in range(ds_count)] )
-        # if cycle_model[idx] < 100:
-        #     rgb[idx,0] = 0.5
-        #     # rgb[idx,1] = 0.5
-        #     # rgb[idx,0] = 1.0 - (onco[idx] - onco_min)/onco_range
-        #     # rgb[idx,1] = (onco[idx] - onco_min)/onco_range
-        #     rgb[idx,1] = rgb[idx,0]
-        #     rgb[idx,2] = 0
-        # elif cycle_model[idx] == 100:
-        #     rgb[idx,0] = 1
-        #     rgb[idx,1] = 0
-        #     rgb[idx,2] = 0
-        # elif cycle_model[idx] > 100:
-        #     rgb[idx,0] = 0.54   # 139./255
-        #     rgb[idx,1] = 0.27   # 69./255
-        #     rgb[idx,2] = 0.075  # 19./255
+    # cell type 0 stays yellow, every other type gets its random color
+    rgb = colorize(mcds.data['discrete_cells'],
+                   cell_type_scheme(cellid_color) + [(('cell_type', '==', 0), YELLOW)])
 #----------------------
 
     colors = np.ones((xyz.shape[0], 4))
@@ -230,7 +190,9 @@ if __name__ == '__main__':
         fragOutput0 = vec4(max(df_1 * color, sf_1 * vec3(1)), 1);
         """
 
-    global spheres_actor
+    global colors_array, spheres_actor, visible
+    colors_array = None
+    visible = None
     spheres_actor = actor.billboard(xyz, colors, scales=cell_radii,
                                     fs_impl=fake_sphere)
     scene.add(spheres_actor)
@@ -0,0 +1,301 @@
+# Write synthetic PhysiCell output frames (MultiCellDS xml + .mat files) with
+# any number of cells, for benchmarking and testing without a simulation.
+#
+#   python make_synthetic_frames.py bench_data 1000000 5000000
+#
+# The cells fill a ball at roughly the density of a tumor spheroid and the
+# microenvironment mesh covers it, with an oxygen and an immunostimulatory
+# factor field. The .mat files are written a block of cells at a time, so
+# even very large frames never have to fit in memory.
+
+import argparse
+import struct
+from pathlib import Path
+
+import numpy as np
+
+# same cell variables, in the same order, as the PhysiCell tumor output
+_LABELS = [('ID', 1), ('position', 3), ('total_volume', 1), ('cell_type', 1),
+           ('cycle_model', 1), ('current_phase', 1), ('elapsed_time_in_phase', 1),
+           ('nuclear_volume', 1), ('cytoplasmic_volume', 1), ('fluid_fraction', 1),
+           ('calcified_fraction', 1), ('orientation', 3), ('polarity', 1),
+           ('migration_speed', 1), ('motility_vector', 3), ('migration_bias', 1),
+           ('motility_bias_direction', 3), ('persistence_time', 1),
+           ('motility_reserved', 1), ('oncoprotein', 1), ('elastic coefficient', 1),
+           ('kill rate', 1), ('attachment lifetime', 1), ('attachment rate', 1)]
+_N_ROWS = sum(size for _, size in _LABELS)
+
+_SUBSTRATES = [('oxygen', 'mmHg', 100000.0, 0.1),
+               ('immunostimulatory factor', 'dimensionless', 1000.0, 0.016)]
+
+_CELL_VOLUME = 2494.
+# PhysiCell meshes have integer voxel spacing, 20 micron by default, which
+# pyMCDS_cells relies on. Larger domains get a coarser, still integer, mesh
+_VOXEL_SIZE = 20
+_MAX_VOXELS_PER_AXIS = 150
+
+# MAT-file level 5 data types and array class
+_MI_INT8 = 1
+_MI_INT32 = 5
+_MI_UINT32 = 6
+_MI_DOUBLE = 9
+_MI_MATRIX = 14
+_MX_DOUBLE_CLASS = 6
+
+_XML_TEMPLATE = '''<?xml version="1.0"?>
+<MultiCellDS version="0.5" type="snapshot/simulation">
+	<metadata>
+		<software>
+			<name>BioFVM</name>
+			<version>1.1.7</version>
+			<URL>http://BioFVM.MathCancer.org</URL>
+			<creator />
+			<citation />
+			<user />
+		</software>
+		<citation />
+		<current_time units="min">{time:f}</current_time>
+		<current_runtime units="sec">0.000000</current_runtime>
+		<created>2020-08-19T18:33:01Z</created>
+		<last_modified>2020-08-19T18:33:01Z</last_modified>
+	</metadata>
+	<microenvironment>
+		<domain name="microenvironment">
+			<mesh type="Cartesian" uniform="true" regular="true" units="micron">
+				<bounding_box type="axis-aligned" units="micron">{lo:f} {lo:f} {lo:f} {hi:f} {hi:f} {hi:f}</bounding_box>
+				<x_coordinates delimiter=" ">{coords}</x_coordinates>
+				<y_coordinates delimiter=" ">{coords}</y_coordinates>
+				<z_coordinates delimiter=" ">{coords}</z_coordinates>
+				<voxels type="matlab">
+					<filename>initial_mesh0.mat</filename>
+				</voxels>
+			</mesh>
+			<variables>
+{variables}
+			</variables>
+			<data type="matlab">
+				<filename>{prefix}_microenvironment0.mat</filename>
+			</data>
+		</domain>
+	</microenvironment>
+	<cellular_information>
+		<cell_populations>
+			<cell_population type="individual">
+				<custom>
+					<simplified_data type="matlab" source="BioFVM">
+						<filename>{prefix}_cells.mat</filename>
+					</simplified_data>
+					<simplified_data type="matlab" source="PhysiCell">
+						<labels>
+{labels}
+						</labels>
+						<filename>{prefix}_cells_physicell.mat</filename>
+					</simplified_data>
+				</custom>
+			</cell_population>
+		</cell_populations>
+	</cellular_information>
+</MultiCellDS>
+'''
+
+_VARIABLE_TEMPLATE = '''				<variable name="{name}" units="{units}" ID="{index}">
+					<physical_parameter_set>
+						<conditions />
+						<diffusion_coefficient units="micron^2/min">{diffusion:f}</diffusion_coefficient>
+						<decay_rate units="1/min">{decay:f}</decay_rate>
+					</physical_parameter_set>
+				</variable>'''
+
+
+def _element(data_type, payload):
+    """
+    Returns a MAT data element: its tag followed by the payload padded to
+    8 bytes.
+    """
+    pad = -len(payload) % 8
+    return struct.pack('<II', data_type, len(payload)) + payload + b'\0' * pad
+
+
+def write_mat_matrix(path, name, n_rows, n_cols, blocks):
+    """
+    Writes a MAT-file (level 5) holding a single double matrix, the format
+    BioFVM and PhysiCell write their output in.
+
+    Parameters
+    ----------
+    path : str
+        File to write
+    name : str
+        Name of the matrix variable, e.g. 'cells'
+    n_rows, n_cols : int
+        Shape of the matrix
+    blocks : iterable
+        Arrays of shape [n_rows, m] whose columns, concatenated, make up the
+        n_cols columns of the matrix
+    """
+    header = b'MATLAB 5.0 MAT-file, written by make_synthetic_frames.py'
+    header = header.ljust(116, b' ') + b'\0' * 8 + struct.pack('<H', 0x0100) + b'IM'
+
+    sub = _element(_MI_UINT32, struct.pack('<II', _MX_DOUBLE_CLASS, 0))
+    sub += _element(_MI_INT32, struct.pack('<ii', n_rows, n_cols))
+    sub += _element(_MI_INT8, name.encode('ascii'))
+    n_bytes = 8 * n_rows * n_cols
+    matrix_size = len(sub) + 8 + n_bytes
+
+    written = 0
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(struct.pack('<II', _MI_MATRIX, matrix_size))
+        f.write(sub)
+        f.write(struct.pack('<II', _MI_DOUBLE, n_bytes))
+        for block in blocks:
+            # column major, the transpose of a C-ordered block is exactly that
+            f.write(np.ascontiguousarray(block.T, dtype='<f8').tobytes())
+            written += block.shape[1]
+    if written != n_cols:
+        raise ValueError('blocks held {} columns, expected {}'.format(written, n_cols))
+
+
+def _cell_blocks(n_cells, radius, rng, block_size):
+    next_id = 0
+    for start in range(0, n_cells, block_size):
+        m = min(block_size, n_cells - start)
+        block = np.zeros((_N_ROWS, m))
+        block[0] = np.arange(next_id, next_id + m)
+        next_id += m
+
+        # uniform in the ball
+        direction = rng.normal(size=(3, m))
+        direction /= np.linalg.norm(direction, axis=0)
+        block[1:4] = direction * radius * np.cbrt(rng.random(m))
+
+        block[4] = rng.normal(_CELL_VOLUME, 0.1 * _CELL_VOLUME, m)
+        block[5] = rng.integers(0, 2, m)
+        block[6] = rng.choice([5, 100, 101], m, p=[0.8, 0.1, 0.1])
+        block[7] = np.where(block[6] == 5, rng.integers(0, 14, m),
+                            np.where(block[6] == 100, 100, rng.integers(101, 104, m)))
+        block[8] = rng.uniform(0, 600, m)
+        block[9] = 0.2 * block[4]
+        block[10] = block[4] - block[9]
+        block[11] = 0.75
+        block[13:16] = direction
+        block[16:] = rng.random((_N_ROWS - 16, m))
+        yield block
+
+
+def _voxel_blocks(coords, volume, rows_after, block_size):
+    n_axis = coords.shape[0]
+    n_voxels = n_axis ** 3
+    for start in range(0, n_voxels, block_size):
+        flat = np.arange(start, min(start + block_size, n_voxels))
+        # x varies fastest, as in BioFVM
+        k, j, i = np.unravel_index(flat, (n_axis, n_axis, n_axis))
+        centers = np.vstack([coords[i], coords[j], coords[k]])
+        block = [centers, np.full((1, flat.shape[0]), volume)]
+        block += rows_after(centers)
+        yield np.vstack(block)
+
+
+def write_synthetic_frame(output_path, n_cells, index=0, time=0., seed=0,
+                          domain_cells=None, block_size=1 << 18):
+    """
+    Writes one synthetic frame: output<index>.xml, its cells and
+    microenvironment .mat files and, if missing, initial_mesh0.mat.
+
+    Parameters
+    ----------
+    output_path : str
+        Directory to write to, created if needed
+    n_cells : int
+        Number of cells in the frame
+    index : int, optional
+        Frame number used in the file names (default= 0)
+    time : float, optional
+        Simulated time of the frame in minutes (default= 0.)
+    seed : int, optional
+        Seed of the random cell and substrate data (default= 0)
+    domain_cells : int, optional
+        Cell count the domain is sized for. Frames written to the same
+        directory share initial_mesh0.mat, so give them all the largest
+        cell count of the series (default= None, n_cells)
+    block_size : int, optional
+        Number of cells (or voxels) generated and written at a time
+
+    Returns
+    -------
+    xml_file : str
+        Name of the xml file written
+    """
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    prefix = 'output{:08d}'.format(index)
+
+    # spheroid at ~64% packing, inside a domain with at least a 100 micron
+    # margin, made of whole voxels
+    if domain_cells is None:
+        domain_cells = n_cells
+    width = 2 * (np.cbrt(max(domain_cells, 1) * _CELL_VOLUME / 0.64 * 0.75 / np.pi) + 100.)
+    radius = np.cbrt(max(n_cells, 1) * _CELL_VOLUME / 0.64 * 0.75 / np.pi)
+    dx = max(_VOXEL_SIZE, int(np.ceil(width / _MAX_VOXELS_PER_AXIS)))
+    n_axis = max(2, int(np.ceil(width / dx)))
+    half_width = n_axis * dx / 2.
+    coords = -half_width + dx * (np.arange(n_axis) + 0.5)
+
+    write_mat_matrix(output_path / (prefix + '_cells_physicell.mat'), 'cells',
+                     _N_ROWS, n_cells, _cell_blocks(n_cells, radius, rng, block_size))
+
+    def substrates(centers):
+        r = np.linalg.norm(centers, axis=0)
+        oxygen = 38. * np.clip(r / radius, 0., 1.) + 0.1 * time / 1440.
+        factor = np.exp(-r / radius)
+        return [oxygen[None, :], factor[None, :]]
+
+    n_voxels = n_axis ** 3
+    write_mat_matrix(output_path / (prefix + '_microenvironment0.mat'),
+                     'multiscale_microenvironment', 4 + len(_SUBSTRATES), n_voxels,
+                     _voxel_blocks(coords, dx ** 3, substrates, block_size))
+    mesh_path = output_path / 'initial_mesh0.mat'
+    if not mesh_path.exists():
+        write_mat_matrix(mesh_path, 'mesh', 4, n_voxels,
+                         _voxel_blocks(coords, dx ** 3, lambda centers: [], block_size))
+
+    labels = []
+    row = 0
+    for name, size in _LABELS:
+        labels.append('\t\t\t\t\t\t\t<label index="{}" size="{}">{}</label>'.format(
+            row, size, name))
+        row += size
+    variables = [_VARIABLE_TEMPLATE.format(name=name, units=units, index=i,
+                                           diffusion=diffusion, decay=decay)
+                 for i, (name, units, diffusion, decay) in enumerate(_SUBSTRATES)]
+
+    xml_file = prefix + '.xml'
+    with open(output_path / xml_file, 'w') as f:
+        f.write(_XML_TEMPLATE.format(
+            time=time, lo=-half_width, hi=half_width,
+            coords=' '.join('{:f}'.format(c) for c in coords),
+            variables='\n'.join(variables), prefix=prefix, labels='\n'.join(labels)))
+    return xml_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write synthetic PhysiCell output frames with the given cell counts.')
+    parser.add_argument('output_path', help='directory to write the frames to')
+    parser.add_argument('n_cells', type=int, nargs='+',
+                        help='cell count of each frame, one frame per value')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    args = parser.parse_args(argv)
+
+    for index, n_cells in enumerate(args.n_cells):
+        # frames of different sizes need their own mesh, so each gets a
+        # directory of its own
+        frame_dir = Path(args.output_path) / 'cells_{}'.format(n_cells)
+        xml_file = write_synthetic_frame(frame_dir, n_cells, index=0,
+                                         time=1440. * index, seed=args.seed + index)
+        print('Wrote {} ({} cells)'.format(frame_dir / xml_file, n_cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,1089 @@
 import xml.etree.ElementTree as ET
+import functools
+import json
 import numpy as np
 import pandas as pd
-import scipy.io as sio
-import sys
+import os
+import struct
+import time
 import warnings
+import weakref
+from collections.abc import MutableMapping
 from pathlib import Path
 
+# version of the on-disk layout written by the columnar frame cache
+_CACHE_FORMAT = 2
+
+# number of cells summarized by each entry of the cache zone maps, and the
+# cell variables they are kept for
+_CACHE_BLOCK_SIZE = 1 << 16
+_ZONE_MAP_LABELS = ['position_x', 'position_y', 'position_z', 'cell_type', 'cycle_model']
+
+# environment variable that turns on stage profiling for every pyMCDS_cells
+_PROFILE_ENV = 'PYMCDS_PROFILE'
+
+# dtypes used by compact=True for the integer valued cell variables, every
+# other variable is stored as float32
+_COMPACT_DTYPES = {
+    'ID': np.int32,
+    'cell_type': np.uint16,
+    'cycle_model': np.uint8,
+    'current_phase': np.uint8,
+}
+
+# MAT-file level 5 data types and array classes used by _locate_mat_matrix
+_MI_DOUBLE = 9
+_MI_MATRIX = 14
+_MX_DOUBLE_CLASS = 6
+_MX_COMPLEX_FLAG = 0x800
+
+
+class _CellColumns(MutableMapping):
+    """
+    Dictionary-like container for the discrete cell data. Columns are only
+    materialized the first time they are accessed, so a frame pays for the
+    labels that are actually used rather than for all of them.
+
+    Parameters
+    ----------
+    labels : list (str)
+        Ordered names of the columns available in this container.
+    loader : callable
+        Called with the container and a column name, returns the 1-D array
+        for that column.
+
+    Attributes
+    ----------
+    on_change : weakref.WeakMethod
+        Called whenever a column is added, replaced or removed, as long as
+        its object is alive (default= None). It is not pickled or copied.
+    """
+    def __init__(self, labels, loader):
+        self._labels = list(labels)
+        self._loader = loader
+        self._columns = {}
+        self.on_change = None
+
+    def __getitem__(self, key):
+        if key in self._columns:
+            return self._columns[key]
+        if key not in self._labels:
+            raise KeyError(key)
+        col = self._loader(self, key)
+        self._columns[key] = col
+        return col
+
+    def __setitem__(self, key, value):
+        if key not in self._labels:
+            self._labels.append(key)
+        self._columns[key] = value
+        self._changed()
+
+    def __delitem__(self, key):
+        if key not in self._labels:
+            raise KeyError(key)
+        self._labels.remove(key)
+        self._columns.pop(key, None)
+        self._changed()
+
+    def __contains__(self, key):
+        return key in self._labels
+
+    def __getstate__(self):
+        # a weak method can't be pickled, the owner reconnects it
+        state = self.__dict__.copy()
+        state['on_change'] = None
+        return state
+
+    def _changed(self):
+        callback = self.on_change() if self.on_change is not None else None
+        if callback is not None:
+            callback()
+
+    def __iter__(self):
+        return iter(self._labels)
+
+    def __len__(self):
+        return len(self._labels)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self._labels)
+
+    def is_loaded(self, key):
+        """
+        Returns True if the column has already been materialized.
+        """
+        return key in self._columns
+
+
+class _LazyDict(dict):
+    """
+    dict that fills in some of its keys the first time they are looked up,
+    by calling the matching entry of loaders with the dict itself.
+    """
+    def __init__(self, loaders):
+        super().__init__()
+        self._loaders = loaders
+
+    def __missing__(self, key):
+        if key not in self._loaders:
+            raise KeyError(key)
+        value = self._loaders[key](self)
+        self[key] = value
+        return value
+
+
+def _expand_labels(labels_node):
+    """
+    Turns the <labels> node of the PhysiCell simplified_data into the list of
+    column names, one per row of the cells matrix.
+    """
+    data_labels = []
+    # iterate over 'label's which are children of 'labels' these will be used to
+    # label data arrays
+    for label in labels_node.findall('label'):
+        # I don't like spaces in my dictionary keys
+        fixed_label = label.text.replace(' ', '_')
+        if int(label.get('size')) > 1:
+            # tags to differentiate repeated labels (usually space related)
+            dir_label = ['_x', '_y', '_z']
+            for i in range(int(label.get('size'))):
+                data_labels.append(fixed_label + dir_label[i])
+        else:
+            data_labels.append(fixed_label)
+    return data_labels
+
+
+def _select_labels(data_labels, columns):
+    """
+    Returns the subset of data_labels requested in columns, in file order.
+    A vector label such as 'position' selects all of its components.
+    """
+    if columns is None:
+        return list(data_labels)
+    if isinstance(columns, str):
+        columns = [columns]
+
+    wanted = set()
+    for name in columns:
+        name = name.replace(' ', '_')
+        matches = [lab for lab in data_labels
+                   if lab == name or lab in (name + '_x', name + '_y', name + '_z')]
+        if not matches:
+            raise ValueError('Unknown cell variable {!r}, expected one of {}'.format(
+                name, data_labels))
+        wanted.update(matches)
+
+    return [lab for lab in data_labels if lab in wanted]
+
+
+def _read_mat_tag(buf, pos, endian):
+    """
+    Reads the tag of a MAT-file data element at pos. Returns the data type,
+    the number of data bytes, the position of the data and the position of
+    the next element, handling the small data element format used for
+    payloads of 4 bytes or less.
+    """
+    data_type, n_bytes = struct.unpack_from(endian + 'II', buf, pos)
+    if data_type >> 16:
+        return data_type & 0xffff, data_type >> 16, pos + 4, pos + 8
+    return data_type, n_bytes, pos + 8, pos + 8 + (n_bytes + 7) // 8 * 8
+
+
+def _locate_mat_matrix(path, name):
+    """
+    Finds an uncompressed, real, 2-D double matrix called name in a level 5
+    MAT-file, which is the layout PhysiCell and BioFVM write.
+
+    Returns
+    -------
+    location : tuple or None
+        (dtype, shape, offset) of the matrix body, ready to be handed to
+        np.memmap with order='F', or None if the file uses anything else
+        (compression, other classes, MAT v4 or v7.3).
+    """
+    with open(path, 'rb') as f:
+        header = f.read(128)
+        if len(header) < 128 or header[126:128] not in (b'IM', b'MI'):
+            return None
+        endian = '<' if header[126:128] == b'IM' else '>'
+        if struct.unpack_from(endian + 'H', header, 124)[0] != 0x0100:
+            return None
+
+        file_size = os.fstat(f.fileno()).st_size
+        pos = 128
+        while pos + 8 <= file_size:
+            f.seek(pos)
+            tag = f.read(8)
+            data_type, n_bytes = struct.unpack(endian + 'II', tag)
+            if data_type != _MI_MATRIX:
+                # compressed variables (miCOMPRESSED) are left to scipy
+                return None
+
+            # the array flags, dimensions and name sub-elements are small,
+            # the real part follows them
+            sub = f.read(min(n_bytes, 256))
+            sub_type, sub_bytes, data_pos, sub_pos = _read_mat_tag(sub, 0, endian)
+            flags = struct.unpack_from(endian + 'I', sub, data_pos)[0]
+
+            sub_type, sub_bytes, data_pos, sub_pos = _read_mat_tag(sub, sub_pos, endian)
+            shape = struct.unpack_from(endian + '{}i'.format(sub_bytes // 4), sub, data_pos)
+
+            sub_type, sub_bytes, data_pos, sub_pos = _read_mat_tag(sub, sub_pos, endian)
+            var_name = sub[data_pos:data_pos + sub_bytes].decode('ascii', 'replace')
+
+            if var_name == name:
+                sub_type, sub_bytes, data_pos, sub_pos = _read_mat_tag(sub, sub_pos, endian)
+                if (flags & 0xff) != _MX_DOUBLE_CLASS or flags & _MX_COMPLEX_FLAG \
+                        or sub_type != _MI_DOUBLE or len(shape) != 2 \
+                        or sub_bytes != 8 * shape[0] * shape[1]:
+                    return None
+                offset = pos + 8 + data_pos
+                if offset + sub_bytes > file_size:
+                    return None
+                return np.dtype(endian + 'f8'), shape, offset
+
+            pos += 8 + (n_bytes + 7) // 8 * 8
+
+    return None
+
+
+def _read_mat_matrix(path, name):
+    """
+    Returns the matrix called name from a MAT-file. PhysiCell's uncompressed
+    layout is memory-mapped copy-on-write, so nothing is read until it is
+    used and the arrays stay writable without touching the file. Anything
+    else goes through scipy.io.loadmat.
+    """
+    try:
+        location = _locate_mat_matrix(path, name)
+    except (struct.error, UnicodeError):
+        location = None
+
+    if location is not None:
+        dtype, shape, offset = location
+        return np.memmap(path, dtype=dtype, mode='c', offset=offset,
+                         shape=shape, order='F')
+
+    import scipy.io as sio
+    return sio.loadmat(path)[name]
+
+
+def _parse_xml(xml_file, record=None):
+    """
+    Parses a MultiCellDS xml file for the simulated time, the runtime, the
+    PhysiCell cell labels and .mat filename and the microenvironment domain.
+
+    If given, record is called with (stage, seconds, bytes) for the parse.
+
+    Returns
+    -------
+    frame : dict
+        'metadata' (same keys as MCDS['metadata']), 'labels' (expanded
+        column names), 'cells_file' (name of the cells .mat file) and
+        'domain' (the microenvironment <domain> node, None if missing)
+    """
+    start = time.perf_counter()
+    root = ET.parse(xml_file).getroot()
+
+    # Get current simulated time
+    metadata_node = root.find('metadata')
+    time_node = metadata_node.find('current_time')
+    metadata = {}
+    metadata['current_time'] = float(time_node.text)
+    metadata['time_units'] = time_node.get('units')
+
+    # Get current runtime
+    time_node = metadata_node.find('current_runtime')
+    metadata['current_runtime'] = float(time_node.text)
+    metadata['runtime_units'] = time_node.get('units')
+
+    # in order to get to the good stuff we have to pass through a few different
+    # hierarchal levels. We want the PhysiCell data, there is more of it
+    cell_node = None
+    for child in root.iterfind('cellular_information/cell_populations/'
+                               'cell_population/custom/simplified_data'):
+        if child.get('source') == 'PhysiCell':
+            cell_node = child
+            break
+    if cell_node is None:
+        raise ValueError('No PhysiCell cell data found in {}'.format(xml_file))
+
+    me_node = root.find('microenvironment')
+    domain_node = me_node.find('domain') if me_node is not None else None
+
+    if record is not None:
+        record('parse_xml', time.perf_counter() - start, os.path.getsize(xml_file))
+
+    return {'metadata': metadata, 'labels': _expand_labels(cell_node.find('labels')),
+            'cells_file': cell_node.find('filename').text.strip(),
+            'domain': domain_node}
+
+
+def read_frame_info(xml_file, output_path='.'):
+    """
+    Reads the time and number of cells of a single output frame without
+    loading any cell data. Only the xml file and the header of the cells .mat
+    file are read.
+
+    Parameters
+    ----------
+    xml_file : str
+        Name of the xml file without the path
+    output_path : str, optional
+        Directory where the PhysiCell output files are stored (default= ".")
+
+    Returns
+    -------
+    info : dict
+        'xml_file', 'current_time', 'time_units', 'current_runtime',
+        'runtime_units', 'cells_file' and 'n_cells'
+    """
+    xml_path = Path(output_path) / xml_file
+    frame = _parse_xml(xml_path)
+    cell_path = Path(output_path) / frame['cells_file']
+
+    location = _locate_mat_matrix(cell_path, 'cells')
+    if location is not None:
+        n_cells = location[1][1]
+    else:
+        n_cells = _read_mat_matrix(cell_path, 'cells').shape[1]
+
+    info = {'xml_file': Path(xml_file).name}
+    info.update(frame['metadata'])
+    info['cells_file'] = frame['cells_file']
+    info['n_cells'] = int(n_cells)
+    return info
+
+
+def scan_output_dir(output_path='.', pattern='output*.xml'):
+    """
+    Runs read_frame_info over every frame in an output directory.
+
+    Parameters
+    ----------
+    output_path : str, optional
+        Directory where the PhysiCell output files are stored (default= ".")
+    pattern : str, optional
+        Glob pattern selecting the frame xml files (default= "output*.xml")
+
+    Returns
+    -------
+    frames : list (dict)
+        One read_frame_info dict per frame, sorted by simulated time
+    """
+    frames = [read_frame_info(xml_path.name, output_path)
+              for xml_path in Path(output_path).glob(pattern)]
+    frames.sort(key=lambda info: (info['current_time'], info['xml_file']))
+    return frames
+
+
+def _nearest_index(coords, values):
+    """
+    Index of the entry of the sorted array coords closest to each value.
+    Values beyond either end map to the first or last entry.
+    """
+    return np.searchsorted((coords[1:] + coords[:-1]) / 2., values)
+
+
+def _linear_weights(coords, values):
+    """
+    For linear interpolation along one axis of sorted coords, returns the
+    indices of the coordinates below and above each value and the weight
+    of the upper one. Values beyond either end are clamped.
+    """
+    if coords.shape[0] == 1:
+        zeros = np.zeros(values.shape, dtype=np.intp)
+        return zeros, zeros, np.zeros(values.shape)
+
+    lo = np.clip(np.searchsorted(coords, values, side='right') - 1,
+                 0, coords.shape[0] - 2)
+    hi = lo + 1
+    t = np.clip((values - coords[lo]) / (coords[hi] - coords[lo]), 0., 1.)
+    return lo, hi, t
+
+
+def _compact_dtype(label, col):
+    """
+    Returns the compact dtype for a cell variable, see _COMPACT_DTYPES.
+    Integer columns whose values do not fit the compact type are kept as
+    float32.
+    """
+    dtype = np.dtype(_COMPACT_DTYPES.get(label, np.float32))
+    if dtype.kind in 'iu' and col.size:
+        info = np.iinfo(dtype)
+        if col.min() < info.min or col.max() > info.max:
+            warnings.warn('{} does not fit in {}, storing it as float32'.format(
+                label, dtype))
+            dtype = np.dtype(np.float32)
+    return dtype
+
+
+def _compact_column(label, col):
+    """
+    Casts a cell variable to its compact dtype.
+    """
+    return col.astype(_compact_dtype(label, col))
+
+
+def _profiled(stage, count_bytes=None):
+    """
+    Records the calls of a pyMCDS_cells or _FrameReader method as a loading
+    stage when the frame is being profiled. count_bytes, if given, is called with the frame
+    and the method's return value and returns the number of bytes read.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            if self._profile is None:
+                return method(self, *args)
+            start = time.perf_counter()
+            value = method(self, *args)
+            n_bytes = count_bytes(self, value) if count_bytes is not None else 0
+            self._record_stage(stage, time.perf_counter() - start, n_bytes)
+            return value
+        return wrapper
+    return decorate
+
+
+def summarize_profile(records):
+    """
+    Adds up profile records per stage, e.g. the records of many frames.
+
+    Parameters
+    ----------
+    records : list (dict)
+        As returned by pyMCDS_cells.get_profile() or passed to the profile
+        callback
+
+    Returns
+    -------
+    summary : pd.DataFrame
+        Indexed by stage, with the number of calls, the total seconds and
+        the total bytes, in the order the stages first ran
+    """
+    records_df = pd.DataFrame(list(records), columns=['xml_file', 'stage', 'seconds', 'bytes'])
+    return records_df.groupby('stage', sort=False).agg(
+        calls=('seconds', 'size'), seconds=('seconds', 'sum'), bytes=('bytes', 'sum'))
+
+
+def _file_signature(path):
+    """
+    Returns the (mtime, size) pair used to decide whether a cache entry is
+    still valid for the file at path.
+    """
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _zone_maps(cell_data, data_labels):
+    """
+    Returns the per-block [mins, maxs] of the _ZONE_MAP_LABELS rows of the
+    cells matrix, which let a CellFilter skip whole blocks of a cached frame.
+    """
+    starts = np.arange(0, cell_data.shape[1], _CACHE_BLOCK_SIZE)
+    zones = {}
+    for row, label in enumerate(data_labels):
+        if label in _ZONE_MAP_LABELS:
+            col = cell_data[row, :]
+            if starts.size:
+                zones[label] = [np.minimum.reduceat(col, starts).tolist(),
+                                np.maximum.reduceat(col, starts).tolist()]
+            else:
+                zones[label] = [[], []]
+    return zones
+
+
+class CellFilter:
+    """
+    Selects the cells of a frame by position, cell type and cycle model. It is
+    applied once while pyMCDS_cells materializes the cell columns, so only the
+    cells that pass are ever copied out of the cells matrix or the cache. A
+    cell is kept if it satisfies every condition given.
+
+    Parameters
+    ----------
+    box : tuple, optional
+        ((x_min, y_min, z_min), (x_max, y_max, z_max)), keeps cells with
+        min <= position < max along every axis. Any bound may be None.
+    half_space : tuple, optional
+        (normal, offset), keeps cells with dot(normal, position) < offset,
+        e.g. ((0, 0, 1), 0.0) keeps the cells below the z = 0 plane
+    cell_types : iterable (int), optional
+        Keeps cells whose cell_type is one of these
+    cycle_model : tuple, optional
+        (low, high), keeps cells with low <= cycle_model < high, either end
+        may be None, e.g. (None, 100) keeps the live cells
+    """
+    def __init__(self, box=None, half_space=None, cell_types=None, cycle_model=None):
+        if box is None and half_space is None and cell_types is None \
+                and cycle_model is None:
+            raise ValueError('CellFilter needs at least one condition')
+
+        self.box = None
+        if box is not None:
+            lo, hi = box
+            self.box = (np.array([-np.inf if v is None else v for v in lo], dtype=float),
+                        np.array([np.inf if v is None else v for v in hi], dtype=float))
+        self.half_space = None
+        if half_space is not None:
+            normal, offset = half_space
+            self.half_space = (np.asarray(normal, dtype=float), float(offset))
+        self.cell_types = None
+        if cell_types is not None:
+            self.cell_types = np.unique(np.asarray(list(cell_types), dtype=float))
+        self.cycle_model = None
+        if cycle_model is not None:
+            low, high = cycle_model
+            self.cycle_model = (-np.inf if low is None else low,
+                                np.inf if high is None else high)
+
+    def __repr__(self):
+        conditions = ['{}={}'.format(name, getattr(self, name))
+                      for name in ['box', 'half_space', 'cell_types', 'cycle_model']
+                      if getattr(self, name) is not None]
+        return 'CellFilter({})'.format(', '.join(conditions))
+
+    def get_labels(self):
+        """
+        Returns the cell variables the filter is evaluated on.
+        """
+        labels = []
+        if self.box is not None or self.half_space is not None:
+            labels += ['position_x', 'position_y', 'position_z']
+        if self.cell_types is not None:
+            labels.append('cell_type')
+        if self.cycle_model is not None:
+            labels.append('cycle_model')
+        return labels
+
+    def mask(self, get_column):
+        """
+        Evaluates the filter.
+
+        Parameters
+        ----------
+        get_column : callable
+            Called with the name of a cell variable, returns its 1-D array
+
+        Returns
+        -------
+        keep : array (bool) shape=[n_cells,]
+        """
+        keep = None
+
+        def both(keep, cond):
+            return cond if keep is None else keep & cond
+
+        if self.box is not None:
+            for axis, name in enumerate(['position_x', 'position_y', 'position_z']):
+                lo, hi = self.box[0][axis], self.box[1][axis]
+                if np.isfinite(lo):
+                    keep = both(keep, get_column(name) >= lo)
+                if np.isfinite(hi):
+                    keep = both(keep, get_column(name) < hi)
+
+        if self.half_space is not None:
+            normal, offset = self.half_space
+            dist = 0.
+            for axis, name in enumerate(['position_x', 'position_y', 'position_z']):
+                if normal[axis] != 0:
+                    dist = dist + normal[axis] * get_column(name)
+            keep = both(keep, np.asarray(dist) < offset)
+
+        if self.cell_types is not None:
+            keep = both(keep, np.isin(get_column('cell_type'), self.cell_types))
+
+        if self.cycle_model is not None:
+            cycle_model = get_column('cycle_model')
+            keep = both(keep, (cycle_model >= self.cycle_model[0])
+                        & (cycle_model < self.cycle_model[1]))
+
+        if keep is None or keep.ndim == 0:
+            # a box without finite bounds or a zero normal, which keeps all
+            n_cells = get_column(self.get_labels()[0]).shape[0]
+            keep = np.full(n_cells, True if keep is None else bool(keep))
+        return keep
+
+    def may_match(self, zone):
+        """
+        Returns False if no cell of a block can pass the filter.
+
+        Parameters
+        ----------
+        zone : dict
+            (min, max) of the block for each of get_labels()
+        """
+        if self.box is not None:
+            for axis, name in enumerate(['position_x', 'position_y', 'position_z']):
+                zmin, zmax = zone[name]
+                if zmax < self.box[0][axis] or zmin >= self.box[1][axis]:
+                    return False
+
+        if self.half_space is not None:
+            normal, offset = self.half_space
+            lowest = 0.
+            for axis, name in enumerate(['position_x', 'position_y', 'position_z']):
+                zmin, zmax = zone[name]
+                if normal[axis] > 0:
+                    lowest += normal[axis] * zmin
+                elif normal[axis] < 0:
+                    lowest += normal[axis] * zmax
+            if lowest >= offset:
+                return False
+
+        if self.cell_types is not None:
+            zmin, zmax = zone['cell_type']
+            if not np.any((self.cell_types >= zmin) & (self.cell_types <= zmax)):
+                return False
+
+        if self.cycle_model is not None:
+            zmin, zmax = zone['cycle_model']
+            if zmax < self.cycle_model[0] or zmin >= self.cycle_model[1]:
+                return False
+
+        return True
+
+
+class _FrameReader:
+    """
+    Reads the cells and the microenvironment of one frame on demand, for
+    pyMCDS_cells. The lazy containers of pyMCDS_cells.data call back into the
+    reader and are handed themselves when they do, so the reader never refers
+    to the pyMCDS_cells object or to its data. Dropping a frame therefore
+    frees it right away rather than leaving a reference cycle for the garbage
+    collector. The arguments are those of pyMCDS_cells.
+    """
+    def __init__(self, xml_file, output_path='.', columns=None, cache=False,
+                 compact=False, microenv=False, cell_filter=None, profile=None):
+        if profile is None:
+            profile = os.environ.get(_PROFILE_ENV, '0') not in ('', '0')
+        self._profile = [] if profile else None
+        self._profile_hook = profile if callable(profile) else None
+        self._xml_name = Path(xml_file).name
+        self._columns = columns
+        self._compact = compact
+        self._microenv = microenv
+        if isinstance(cell_filter, dict):
+            cell_filter = CellFilter(**cell_filter)
+        self._filter = cell_filter
+        self._filter_rows = None
+        self._cell_matrix = None
+        self._frame_dir = None
+        self._zone_maps = None
+        self._mesh_axes = None
+        self._domain_node = None
+        if cache is True:
+            cache = Path(output_path) / '.pymcds_cache'
+        self._cache_dir = Path(cache) if cache else None
+
+    def _record_stage(self, stage, seconds, n_bytes):
+        record = {'xml_file': self._xml_name, 'stage': stage,
+                  'seconds': seconds, 'bytes': int(n_bytes)}
+        self._profile.append(record)
+        if self._profile_hook is not None:
+            self._profile_hook(record)
+
+    @_profiled('read_xml')
+    def _read_xml(self, xml_file, output_path='.'):
+        """
+        Does the actual work of initializing MultiCellDS by parsing the xml
+        """
+
+        output_path = Path(output_path)
+        xml_file = output_path / xml_file
+        self._output_path = output_path
+        self._xml_path = xml_file
+        if self._cache_dir is not None:
+            MCDS = self._read_cache(xml_file)
+            if MCDS is not None:
+                return MCDS
+
+        # print('Reading {}'.format(xml_file))
+
+        frame = _parse_xml(xml_file, self._record_stage if self._profile is not None else None)
+        # kept for the mesh and the substrates, which are read on demand
+        self._domain_node = frame['domain']
+        MCDS = self._new_mcds()
+        MCDS['metadata'] = frame['metadata']
+
+        data_labels = frame['labels']
+
+        # load the file
+        cell_file = frame['cells_file']
+        cell_path = output_path / cell_file
+        if not cell_path.is_file():
+            raise FileNotFoundError(
+                "No such file or directory:\n'{}' referenced in '{}'".format(cell_path, xml_file))
+
+        # print('Reading {}'.format(cell_path))
+
+        self._cell_path = cell_path
+        self._cell_rows = {label: row for row, label in enumerate(data_labels)}
+        self._check_filter(xml_file)
+        loader = self._load_cell_column
+        if self._cache_dir is not None and \
+                self._write_cache(xml_file, MCDS['metadata'], data_labels):
+            loader = self._load_cached_column
+        MCDS['discrete_cells'] = _CellColumns(
+            _select_labels(data_labels, self._columns), loader)
+
+        return MCDS
+
+    def _new_mcds(self):
+        """
+        Returns the empty top level container, with the microenvironment
+        entries wired up to be read on first access.
+        """
+        return _LazyDict({'mesh': self._read_mesh,
+                          'continuum_variables': self._read_continuum_variables})
+
+    def _find_microenvironment_node(self):
+        """
+        Returns the microenvironment domain node. Frames served from the
+        cache parse the xml for it on first use, once for both the mesh and
+        the substrates.
+        """
+        if self._domain_node is None:
+            tree = ET.parse(self._xml_path)
+            me_node = tree.getroot().find('microenvironment')
+            self._domain_node = me_node.find('domain')
+        return self._domain_node
+
+    @_profiled('read_mesh')
+    def _read_mesh(self, MCDS):
+        """
+        Parses the mesh of the computational domain out of the xml. The
+        linear voxel centers and volumes are only read if asked for.
+        """
+        mesh_node = self._find_microenvironment_node().find('mesh')
+        MCDS['metadata']['spatial_units'] = mesh_node.get('units')
+        mesh = _LazyDict({'voxels': self._read_voxels})
+
+        # while we're at it, find the mesh
+        coords = []
+        for axis in ['x_coordinates', 'y_coordinates', 'z_coordinates']:
+            coord_node = mesh_node.find(axis)
+            coords.append(np.array(coord_node.text.split(coord_node.get('delimiter')),
+                                   dtype=float))
+
+        # reshape into a mesh grid
+        xx, yy, zz = np.meshgrid(*coords)
+
+        mesh['x_coordinates'] = xx
+        mesh['y_coordinates'] = yy
+        mesh['z_coordinates'] = zz
+        self._mesh_axes = coords
+        self._voxel_file = mesh_node.find('voxels').find('filename').text.strip()
+
+        return mesh
+
+    @_profiled('read_voxels', lambda self, voxels: voxels['centers'].nbytes
+               + voxels['volumes'].nbytes)
+    def _read_voxels(self, mesh):
+        """
+        Voxel data must be loaded from .mat file
+        """
+        voxel_path = self._output_path / self._voxel_file
+        if not voxel_path.is_file():
+            raise FileNotFoundError(
+                "No such file or directory:\n'{}' referenced in '{}'".format(voxel_path, self._xml_path))
+        initial_mesh = _read_mat_matrix(voxel_path, 'mesh')
+
+        # center of voxel specified by first three rows [ x, y, z ]
+        # volume specified by fourth row
+        voxels = {}
+        voxels['centers'] = initial_mesh[:3, :]
+        voxels['volumes'] = initial_mesh[3, :]
+        return voxels
+
+    @_profiled('read_continuum_variables',
+               lambda self, variables: sum(v['data'].nbytes for v in variables.values()))
+    def _read_continuum_variables(self, MCDS):
+        """
+        Reads the substrate concentrations. Unlike in the matlab version the
+        individual chemical species are accessed through their names e.g.
+        MCDS['continuum_variables']['oxygen']['units']
+        MCDS['continuum_variables']['oxygen']['data']
+        """
+        if not self._microenv:
+            raise KeyError('continuum_variables (construct pyMCDS_cells with '
+                           'microenv=True to load the microenvironment)')
+
+        me_node = self._find_microenvironment_node()
+        xx = MCDS['mesh']['x_coordinates']
+        X, Y, Z = self._mesh_axes
+
+        # micro environment data is shape [4+n, len(voxels)] where n is the number
+        # of species being tracked. the first 3 rows represent (x, y, z) of voxel
+        # centers. The fourth row contains the voxel volume. The 5th row and up will
+        # contain values for that species in that voxel.
+        me_file = me_node.find('data').find('filename').text.strip()
+        me_path = self._output_path / me_file
+        if not me_path.is_file():
+            raise FileNotFoundError(
+                "No such file or directory:\n'{}' referenced in '{}'".format(me_path, self._xml_path))
+        me_data = _read_mat_matrix(me_path, 'multiscale_microenvironment')
+
+        # position of every voxel in the meshgrid, worked out once for all
+        # species by snapping each center onto the nearest coordinate
+        i = _nearest_index(X, me_data[0, :])
+        j = _nearest_index(Y, me_data[1, :])
+        k = _nearest_index(Z, me_data[2, :])
+        voxel_idx = np.ravel_multi_index((j, i, k), xx.shape)
+
+        continuum_variables = {}
+        for si, species in enumerate(me_node.find('variables').findall('variable')):
+            species_name = species.get('name')
+            continuum_variables[species_name] = {}
+            continuum_variables[species_name]['units'] = species.get('units')
+
+            # travel down one level on tree
+            species = species.find('physical_parameter_set')
+
+            # diffusion data for each species
+            continuum_variables[species_name]['diffusion_coefficient'] = {}
+            continuum_variables[species_name]['diffusion_coefficient']['value'] \
+                = float(species.find('diffusion_coefficient').text)
+            continuum_variables[species_name]['diffusion_coefficient']['units'] \
+                = species.find('diffusion_coefficient').get('units')
+
+            # decay data for each species
+            continuum_variables[species_name]['decay_rate'] = {}
+            continuum_variables[species_name]['decay_rate']['value'] \
+                = float(species.find('decay_rate').text)
+            continuum_variables[species_name]['decay_rate']['units'] \
+                = species.find('decay_rate').get('units')
+
+            # scatter the voxel values into the meshgrid in one go
+            conc = np.zeros(xx.shape)
+            conc.reshape(-1)[voxel_idx] = me_data[4 + si, :]
+            continuum_variables[species_name]['data'] = conc
+
+        return continuum_variables
+
+    def _frame_cache_dir(self, xml_file):
+        return self._cache_dir / Path(xml_file).stem
+
+    @_profiled('read_cache')
+    def _read_cache(self, xml_file):
+        """
+        Rebuilds MCDS from the columnar cache if there is a valid entry for
+        xml_file. Returns None if the entry is missing or stale. Entries
+        whose source xml file no longer exists, such as the frames of a run
+        exported with pyMCDS_export, are used as they are.
+        """
+        frame_dir = self._frame_cache_dir(xml_file)
+        try:
+            with open(frame_dir / 'meta.json') as f:
+                meta = json.load(f)
+            cell_path = xml_file.parent / meta['cells']['name']
+            if meta['format'] != _CACHE_FORMAT:
+                return None
+            if xml_file.exists() and (
+                    meta['xml']['signature'] != _file_signature(xml_file)
+                    or meta['cells']['signature'] != _file_signature(cell_path)):
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+
+        self._cell_path = cell_path
+        self._cell_rows = {label: row for row, label in enumerate(meta['labels'])}
+        self._check_filter(xml_file)
+        self._frame_dir = frame_dir
+        self._zone_maps = meta['zone_maps']
+
+        MCDS = self._new_mcds()
+        MCDS['metadata'] = meta['metadata']
+        MCDS['discrete_cells'] = _CellColumns(
+            _select_labels(meta['labels'], self._columns),
+            self._load_cached_column)
+        return MCDS
+
+    @_profiled('write_cache')
+    def _write_cache(self, xml_file, metadata, data_labels):
+        """
+        Writes every row of the cells matrix as its own contiguous .npy file.
+        meta.json is written last, so an interrupted write is never mistaken
+        for a valid entry. Every file is written under a temporary name and
+        then renamed over the old one, so frames that still memory-map the
+        files of a stale entry keep seeing their own data. Returns True if
+        the entry was written.
+        """
+        frame_dir = self._frame_cache_dir(xml_file)
+        meta_path = frame_dir / 'meta.json'
+        try:
+            frame_dir.mkdir(parents=True, exist_ok=True)
+            if meta_path.exists():
+                meta_path.unlink()
+
+            cell_data = self._get_cell_matrix()
+            for row, label in enumerate(data_labels):
+                tmp_path = frame_dir / '{}.npy.{}.tmp'.format(label, os.getpid())
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(cell_data[row, :]))
+                os.replace(tmp_path, frame_dir / (label + '.npy'))
+
+            meta = {
+                'format': _CACHE_FORMAT,
+                'xml': {'name': xml_file.name,
+                        'signature': _file_signature(xml_file)},
+                'cells': {'name': self._cell_path.name,
+                          'signature': _file_signature(self._cell_path)},
+                'metadata': metadata,
+                'labels': data_labels,
+                'n_cells': int(cell_data.shape[1]),
+                'zone_maps': _zone_maps(cell_data, data_labels),
+            }
+            tmp_path = frame_dir / 'meta.json.{}.tmp'.format(os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, meta_path)
+        except OSError as e:
+            warnings.warn('Could not write frame cache {}: {}'.format(frame_dir, e))
+            return False
+
+        self._cell_matrix = None
+        self._frame_dir = frame_dir
+        self._zone_maps = meta['zone_maps']
+        return True
+
+    @_profiled('load_column', lambda self, col: col.nbytes)
+    def _load_cached_column(self, cells, label):
+        """
+        Memory-maps a single column from the columnar cache.
+        """
+        col = self._raw_cell_column(label)
+        if self._filter is not None:
+            col = col[self._get_filter_rows()]
+        if self._compact:
+            col = _compact_column(label, col)
+        return col
+
+    def _raw_cell_column(self, label):
+        """
+        Returns a column, for every cell, without copying it.
+        """
+        if self._frame_dir is not None:
+            return np.load(self._frame_dir / (label + '.npy'), mmap_mode='r')
+        return self._get_cell_matrix()[self._cell_rows[label], :]
+
+    def _check_filter(self, xml_file):
+        if self._filter is None:
+            return
+        missing = [label for label in self._filter.get_labels()
+                   if label not in self._cell_rows]
+        if missing:
+            raise ValueError('Cannot filter on {}, not in the cell data of {}'.format(
+                missing, xml_file))
+
+    def _get_filter_rows(self):
+        """
+        Returns the indices of the cells passing the filter. On cached frames
+        the zone maps are consulted first and blocks that cannot contain a
+        passing cell are never read.
+        """
+        if self._filter_rows is None:
+            self._filter_rows = self._find_filter_rows()
+        return self._filter_rows
+
+    @_profiled('filter_rows')
+    def _find_filter_rows(self):
+        if self._zone_maps is None:
+            rows = np.flatnonzero(self._filter.mask(self._raw_cell_column))
+        else:
+            labels = self._filter.get_labels()
+            raw = {label: self._raw_cell_column(label) for label in labels}
+            n_cells = raw[labels[0]].shape[0]
+            rows = []
+            for block, start in enumerate(range(0, n_cells, _CACHE_BLOCK_SIZE)):
+                zone = {label: (self._zone_maps[label][0][block],
+                                self._zone_maps[label][1][block]) for label in labels}
+                if not self._filter.may_match(zone):
+                    continue
+                stop = min(start + _CACHE_BLOCK_SIZE, n_cells)
+                keep = self._filter.mask(lambda label: raw[label][start:stop])
+                rows.append(np.flatnonzero(keep) + start)
+            rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.intp)
+        return rows
+
+    def _get_cell_matrix(self):
+        """
+        Loads the cells matrix on first use, shape [n_variables, n_cells]
+        """
+        if self._cell_matrix is None:
+            self._cell_matrix = self._read_cell_matrix()
+        return self._cell_matrix
+
+    @_profiled('read_cells_mat', lambda self, cell_data: cell_data.nbytes)
+    def _read_cell_matrix(self):
+        return _read_mat_matrix(self._cell_path, 'cells')
+
+    @_profiled('load_column', lambda self, col: col.nbytes)
+    def _load_cell_column(self, cells, label):
+        """
+        Materializes a single row of the cells matrix as a column.
+
+        When only a subset of columns or cells was requested, or compact
+        dtypes are used, each one is copied out so the full matrix can be
+        released once all of them have been touched.
+        """
+        col = self._get_cell_matrix()[self._cell_rows[label], :]
+        if self._columns is None and not self._compact and self._filter is None:
+            return col
+
+        if self._filter is not None:
+            col = col[self._get_filter_rows()]
+        if self._compact:
+            col = _compact_column(label, col)
+        else:
+            col = np.ascontiguousarray(col)
+        if all(cells.is_loaded(lab) for lab in cells if lab != label):
+            self._cell_matrix = None
+        return col
+
+    def _load_columns_into(self, cells, buffers):
+        """
+        Materializes every selected column into caller owned arrays, so that
+        a stream of frames can reuse the same memory instead of allocating
+        fresh columns for each one.
+
+        Parameters
+        ----------
+        cells : _CellColumns
+            data['discrete_cells'] of the frame
+        buffers : dict
+            Maps column names to 1-D arrays. Arrays that are missing, too
+            short or of the wrong dtype are replaced by larger ones, with some
+            headroom for the cell count growing from frame to frame. The
+            columns of this frame are views of these arrays.
+        """
+        for label in cells:
+            if cells.is_loaded(label):
+                continue
+            src = self._raw_cell_column(label)
+            dtype = _compact_dtype(label, src) if self._compact else src.dtype
+            rows = None
+            n_cells = src.shape[0]
+            if self._filter is not None:
+                rows = self._get_filter_rows()
+                n_cells = rows.shape[0]
+
+            buf = buffers.get(label)
+            if buf is None or buf.shape[0] < n_cells or buf.dtype != dtype:
+                buf = np.empty(n_cells + n_cells // 4, dtype=dtype)
+                buffers[label] = buf
+            col = buf[:n_cells]
+            if rows is None:
+                np.copyto(col, src, casting='unsafe')
+            elif dtype == src.dtype:
+                np.take(src, rows, out=col)
+            else:
+                np.copyto(col, src[rows], casting='unsafe')
+            cells._columns[label] = col
+        self._cell_matrix = None
+
+
 class pyMCDS_cells:
     """
     This class contains a dictionary of dictionaries that contains all of the 
@@ -20,15 +1098,66 @@ class pyMCDS_cells:
     output_path: str, optional
         String containing the path (relative or absolute) to the directory
         where PhysiCell output files are stored (default= ".")
+    columns: list (str), optional
+        Names of the cell variables to load, e.g. ['position', 'cell_type'].
+        Vector variables may be given by their base name. Only these columns
+        are ever copied out of the cells matrix (default= None, all columns)
+    cache: bool or str, optional
+        If True, each frame is converted once into one .npy file per cell
+        variable under output_path/.pymcds_cache and later reads memory-map
+        those files instead of parsing the xml and .mat files. A string gives
+        the cache directory to use instead. Entries are rebuilt whenever the
+        size or modification time of the source files changes. An entry is
+        used as is if its source xml file is gone (default= False)
+    compact: bool, optional
+        If True, cell variables are stored in smaller dtypes: ID as int32,
+        cell_type as uint16, cycle_model and current_phase as uint8 and
+        everything else, positions and volumes included, as float32
+        (default= False)
+    microenv: bool, optional
+        If True, the substrate concentrations are made available through
+        data['continuum_variables'] and the concentration functions. They are
+        only read the first time they are used (default= False)
+    cell_filter: CellFilter or dict, optional
+        Only the cells passing this filter are loaded, a dict is passed on to
+        CellFilter as keyword arguments. With the cache enabled, blocks of
+        cells that cannot pass are skipped without being read
+        (default= None, all cells)
+    profile: bool or callable, optional
+        If True, the time spent in and the bytes read by each loading stage
+        (xml scan, label expansion, .mat reads, column loads, DataFrame
+        construction, microenvironment reads) are recorded, see
+        get_profile(). A callable turns profiling on and is called with each
+        record as it is made. Defaults to on if the PYMCDS_PROFILE
+        environment variable is set to anything but 0 (default= None)
 
     Attributes
     ----------
     data : dict
         Hierarchical container for all of the data retrieved by parsing the xml
-        file and the files referenced therein.
+        file and the files referenced therein. data['discrete_cells'] behaves
+        like a dict, but each column is only materialized on first access.
+        Columns served from the cache are read-only np.memmap arrays.
+        data['mesh'] and data['continuum_variables'] are read from the
+        microenvironment files the first time they are looked up.
     """
-    def __init__(self, xml_file, output_path='.'):
-        self.data = self._read_xml(xml_file, output_path)
+    def __init__(self, xml_file, output_path='.', columns=None, cache=False,
+                 compact=False, microenv=False, cell_filter=None, profile=None):
+        self._reader = _FrameReader(xml_file, output_path, columns, cache, compact,
+                                    microenv, cell_filter, profile)
+        self._profile = self._reader._profile
+        self._mesh_bounds = None
+        self._reset_cell_caches()
+        self.data = self._reader._read_xml(xml_file, output_path)
+        self._watch_cells()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._watch_cells()
+
+    def _watch_cells(self):
+        # a weak reference, so data does not keep the frame alive
+        self.data['discrete_cells'].on_change = weakref.WeakMethod(self._reset_cell_caches)
 
     ## METADATA RELATED FUNCTIONS
 
@@ -94,7 +1223,7 @@ class pyMCDS_cells:
     def get_mesh_spacing(self):
         """
         Returns the space in between voxel centers for the mesh in terms of the
-        mesh's spatial units. Assumes that voxel centers fall on integer values.
+        mesh's spatial units.
 
         Returns
         -------
@@ -102,20 +1231,7 @@ class pyMCDS_cells:
             Distance between voxel centers in the same units as the other 
             spatial measurements
         """
-        centers = self.get_linear_voxels()
-        X = np.unique(centers[0, :])
-        Y = np.unique(centers[1, :])
-        Z = np.unique(centers[2, :])
-
-        dx = (X.max() - X.min()) / X.shape[0]
-        dy = (Y.max() - Y.min()) / Y.shape[0]
-        dz = (Z.max() - Z.min()) / Z.shape[0]
-        
-        if np.abs(dx - dy) > 1e-10 or np.abs(dy - dz) > 1e-10 \
-            or np.abs(dx - dz) > 1e-10:
-            print('Warning: grid spacing may be axis dependent.')
-        
-        return round(dx)
+        return self._get_mesh_bounds()[2]
 
     def get_containing_voxel_ijk(self, x, y, z):
         """
@@ -140,35 +1256,71 @@ class pyMCDS_cells:
         ijk : list length=3
             contains the i, j, and k indices for the containing voxel's center
         """
-        xx, yy, zz = self.get_mesh()
-        ds = self.get_mesh_spacing()
+        mins, maxs, ds = self._get_mesh_bounds()
+        for axis, value in enumerate((x, y, z)):
+            name = 'xyz'[axis]
+            if value > maxs[axis]:
+                warnings.warn('Position out of bounds: {3} out of bounds in pyMCDS._get_voxel_idx({0}, {1}, {2}). Setting {3} = {3}_max!'.format(x, y, z, name))
+            elif value < mins[axis]:
+                warnings.warn('Position out of bounds: {3} out of bounds in pyMCDS._get_voxel_idx({0}, {1}, {2}). Setting {3} = {3}_min!'.format(x, y, z, name))
 
-        if x > xx.max():
-            warnings.warn('Position out of bounds: x out of bounds in pyMCDS._get_voxel_idx({0}, {1}, {2}). Setting x = x_max!'.format(x, y, z))
-            x = xx.max()
-        elif x < xx.min():
-            warnings.warn('Position out of bounds: x out of bounds in pyMCDS._get_voxel_idx({0}, {1}, {2}). Setting x = x_min!'.format(x, y, z))
-            x = xx.min()
-        elif y > yy.max():
-            warnings.warn('Position out of bounds: y out of bounds in pyMCDS._get_voxel_idx({0}, {1}, {2}). Setting y = y_max!'.format(x, y, z))
-            y = yy.max()
-        elif y < yy.min():
-            warnings.warn('Position out of bounds: y out of bounds in pyMCDS._get_voxel_idx({0}, {1}, {2}). Setting y = y_min!'.format(x, y, z))
-            y = yy.min()
-        elif z > zz.max():
-            warnings.warn('Position out of bounds: z out of bounds in pyMCDS._get_voxel_idx({0}, {1}, {2}). Setting z = z_max!'.format(x, y, z))
-            z = zz.max()
-        elif z < zz.min():
-            warnings.warn('Position out of bounds: z out of bounds in pyMCDS._get_voxel_idx({0}, {1}, {2}). Setting z = z_min!'.format(x, y, z))
-            z = zz.min()
-        
-        i = np.round((x - xx.min()) / ds)
-        j = np.round((y - yy.min()) / ds)
-        k = np.round((z - zz.min()) / ds)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            ii, jj, kk = self.get_containing_voxel_ijk_many([x, y, z])
+
+        return [int(ii), int(jj), int(kk)]
+
+    def get_containing_voxel_ijk_many(self, xyz):
+        """
+        Vectorized get_containing_voxel_ijk. Each position goes to the voxel
+        with the nearest center, positions outside the mesh to the closest
+        boundary voxel, with one warning per axis.
+
+        Parameters
+        ----------
+        xyz : array, shape=[n_points, 3] or [3,]
+            Positions of interest
+
+        Returns
+        -------
+        ijk : array (np.int) shape=[n_points, 3] or [3,]
+            i, j and k indices of each containing voxel's center, to be used
+            as [j, i, k] on the meshgrid objects
+        """
+        points = np.asarray(xyz, dtype=float)
+        mins, maxs, ds = self._get_mesh_bounds()
+
+        out_of_bounds = ((points < mins) | (points > maxs)).reshape(-1, 3).sum(axis=0)
+        for axis, n_out in enumerate(out_of_bounds):
+            if n_out:
+                warnings.warn('Position out of bounds: {} position(s) with {} out of bounds in pyMCDS.get_containing_voxel_ijk_many. Clamping them to the mesh!'.format(n_out, 'xyz'[axis]))
+
+        # the same voxel assignment as the spatial index
+        flat = points.reshape(-1, 3)
+        ijk = np.column_stack([_nearest_index(coords, flat[:, axis])
+                               for axis, coords in enumerate(self._get_mesh_axes())])
+        return ijk.reshape(points.shape)
+
+    def _get_mesh_bounds(self):
+        """
+        Returns the smallest and largest voxel centers along each axis and
+        the mesh spacing, computed once per frame.
+        """
+        if self._mesh_bounds is None:
+            X, Y, Z = self._get_mesh_axes()
+
+            # the distance between neighbouring centers, the axes of a 2-D
+            # mesh with a single center have none
+            spacings = [np.diff(coords).mean() for coords in (X, Y, Z)
+                        if coords.shape[0] > 1]
 
-        ii, jj, kk = int(i), int(j), int(k)
+            if np.ptp(spacings) > 1e-10:
+                print('Warning: grid spacing may be axis dependent.')
 
-        return [ii, jj, kk]
+            mins = np.array([X.min(), Y.min(), Z.min()])
+            maxs = np.array([X.max(), Y.max(), Z.max()])
+            self._mesh_bounds = (mins, maxs, float(spacings[0]))
+        return self._mesh_bounds
 
     ## MICROENVIRONMENT RELATED FUNCTIONS
 
@@ -187,7 +1339,8 @@ class pyMCDS_cells:
 
         return species_list
     
-    def get_concentrations(self, species_name, z_slice=None):
+    def get_concentrations(self, species_name, z_slice=None, x_slice=None,
+                           y_slice=None):
         """
         Returns the concentration array for the specified chemical species
         in the microenvironment. Can return either the whole 3D picture, or
@@ -198,27 +1351,51 @@ class pyMCDS_cells:
         species_name : str
             Name of the chemical species for which to get concentrations
         
-        z_slice : float
+        z_slice : float or list (float)
             z-axis position to use as plane for 2D output. This value must match
-            a plane of voxel centers in the z-axis.
+            a plane of voxel centers in the z-axis. A list of positions returns
+            those planes stacked along the z-axis.
+        x_slice : float or list (float)
+            Same as z_slice, along the x-axis
+        y_slice : float or list (float)
+            Same as z_slice, along the y-axis
         Returns
         -------
         conc_arr : array (np.float) shape=[nx_voxels, ny_voxels, nz_voxels]
             Contains the concentration of the specified chemical in each voxel.
-            The array spatially maps to a meshgrid of the voxel centers.
+            The array spatially maps to a meshgrid of the voxel centers. A
+            single slice drops the sliced axis, e.g. [ny_voxels, nx_voxels]
+            for z_slice. Single slices and evenly spaced lists of slices are
+            views of the full array, not copies.
         """
-        if z_slice is not None:
-            # check to see that z_slice is a valid plane
-            zz = self.data['mesh']['z_coordinates']
-            assert z_slice in zz, 'Specified z_slice {} not in z_coordinates'.format(z_slice)
-
-            # do the processing if its ok
-            mask = zz == z_slice
-            full_conc = self.data['continuum_variables'][species_name]['data']
-            conc_arr = full_conc[mask].reshape((zz.shape[0], zz.shape[1]))
+        full_conc = self.data['continuum_variables'][species_name]['data']
+        slices = [(name, value, axis) for name, value, axis in
+                  (('x', x_slice, 1), ('y', y_slice, 0), ('z', z_slice, 2))
+                  if value is not None]
+        if not slices:
+            return full_conc
+        assert len(slices) == 1, 'Only one of x_slice, y_slice and z_slice can be given'
+
+        # map the requested positions to plane indices once
+        name, value, axis = slices[0]
+        coords = self._get_mesh_axes()['xyz'.index(name)]
+        values = np.atleast_1d(np.asarray(value, dtype=float))
+        planes = _nearest_index(coords, values)
+        for v, plane in zip(values, planes):
+            assert abs(coords[plane] - v) < 1e-10, \
+                'Specified {}_slice {} not in {}_coordinates'.format(name, v, name)
+
+        index = [slice(None)] * 3
+        if np.ndim(value) == 0:
+            index[axis] = planes[0]
         else:
-            conc_arr = self.data['continuum_variables'][species_name]['data']
+            steps = np.diff(planes)
+            if planes.shape[0] > 1 and steps[0] > 0 and np.all(steps == steps[0]):
+                index[axis] = slice(planes[0], planes[-1] + 1, steps[0])
+            else:
+                index[axis] = planes
 
+        conc_arr = full_conc[tuple(index)]
         return conc_arr
 
     def get_concentrations_at(self, x, y, z):
@@ -249,20 +1426,111 @@ class pyMCDS_cells:
         
         return concs
 
+    def get_concentrations_at_many(self, xyz, method='nearest'):
+        """
+        Samples every chemical species at many positions at once, e.g. at
+        get_cell_positions().
+
+        Parameters
+        ----------
+        xyz : array, shape=[n_points, 3]
+            Positions of interest
+        method : str
+            'nearest' returns the value of the containing voxel, exactly as
+            get_concentrations_at does. 'trilinear' interpolates between the
+            eight surrounding voxel centers; positions beyond the outermost
+            centers take the value at the boundary.
+
+        Returns
+        -------
+        concs : array, shape=[n_points, n_substrates]
+            concentrations in the order given by get_substrate_names()
+        """
+        points = np.atleast_2d(np.asarray(xyz, dtype=float))
+        sub_name_list = self.get_substrate_names()
+        shape = self.data['mesh']['x_coordinates'].shape
+        concs = np.empty((points.shape[0], len(sub_name_list)))
+
+        if method == 'nearest':
+            ijk = self.get_containing_voxel_ijk_many(points)
+            flat = np.ravel_multi_index((ijk[:, 1], ijk[:, 0], ijk[:, 2]), shape)
+            for ix, name in enumerate(sub_name_list):
+                concs[:, ix] = self.get_concentrations(name).reshape(-1)[flat]
+
+        elif method == 'trilinear':
+            # the eight corners and their weights are shared by all species
+            X, Y, Z = self._get_mesh_axes()
+            i0, i1, tx = _linear_weights(X, points[:, 0])
+            j0, j1, ty = _linear_weights(Y, points[:, 1])
+            k0, k1, tz = _linear_weights(Z, points[:, 2])
+
+            corners = []
+            for jc, wy in ((j0, 1. - ty), (j1, ty)):
+                for ic, wx in ((i0, 1. - tx), (i1, tx)):
+                    for kc, wz in ((k0, 1. - tz), (k1, tz)):
+                        corners.append((np.ravel_multi_index((jc, ic, kc), shape),
+                                        wx * wy * wz))
+
+            for ix, name in enumerate(sub_name_list):
+                conc = self.get_concentrations(name).reshape(-1)
+                concs[:, ix] = sum(weight * conc[flat] for flat, weight in corners)
+
+        else:
+            raise ValueError("method must be 'nearest' or 'trilinear', got {!r}".format(method))
+
+        return concs
+
 
     ## CELL RELATED FUNCTIONS
 
     def get_cell_df(self):
         """
-        Builds DataFrame from data['discrete_cells']
+        Builds DataFrame from data['discrete_cells']. The DataFrame is built
+        once and cached, when all columns come straight from the cells matrix
+        it is a view of that matrix rather than a copy. Use .copy() before
+        modifying it in place.
 
         Returns
         -------
         cells_df : pd.Dataframe, shape=[n_cells, n_variables]
             Dataframe containing the cell data for all cells at this time step
         """
-        cells_df = pd.DataFrame(self.data['discrete_cells'])
-        return cells_df
+        if self._cell_df is None:
+            self._cell_df = self._build_cell_df()
+        return self._cell_df
+
+    @_profiled('build_cell_df', lambda self, df: df.memory_usage(index=False).sum())
+    def _build_cell_df(self):
+        cells = self.data['discrete_cells']
+        labels = list(cells)
+        reader = self._reader
+        if reader._columns is None and not reader._compact and reader._filter is None \
+                and reader._frame_dir is None and all(label in reader._cell_rows for label in labels):
+            cell_data = reader._get_cell_matrix()
+            # only while every column still is its row of the matrix, not
+            # after one was replaced, e.g. data['discrete_cells'][label] = ...
+            if all(not cells.is_loaded(label) or np.may_share_memory(cells[label], cell_data)
+                   for label in labels):
+                # the matrix is [n_variables, n_cells] in Fortran order, so
+                # its transpose is a C-contiguous [n_cells, n_variables]
+                # block that pandas can wrap without consolidating or copying
+                rows = [reader._cell_rows[label] for label in labels]
+                if rows == list(range(cell_data.shape[0])):
+                    block = cell_data.T
+                else:
+                    block = cell_data[rows, :].T
+                return pd.DataFrame(block, columns=labels, copy=False)
+
+        return pd.DataFrame(dict(cells))
+
+    def _reset_cell_caches(self):
+        """
+        Drops everything derived from data['discrete_cells'].
+        """
+        self._cell_df = None
+        self._cell_positions = None
+        self._voxel_index = None
+        self._kdtree = None
     
     def get_cell_variables(self):
         """
@@ -306,200 +1574,248 @@ class pyMCDS_cells:
         y_vox = yy[j, i, k]
         z_vox = zz[j, i, k]
 
-        cell_df = self.get_cell_df()
-        inside_voxel = ( (cell_df['position_x'] < x_vox + ds/2.) &
-                         (cell_df['position_x'] > x_vox - ds/2.) &
-                         (cell_df['position_y'] < y_vox + ds/2.) &
-                         (cell_df['position_y'] > y_vox - ds/2.) &
-                         (cell_df['position_z'] < z_vox + ds/2.) &
-                         (cell_df['position_z'] > z_vox - ds/2.) )
-        vox_df = cell_df[inside_voxel]
+        # only cells binned into this voxel or one of its neighbours can be
+        # inside it, so just those are tested
+        rows = self._cells_around_voxel(i, j, k)
+        pos = self.get_cell_positions()[rows]
+        inside_voxel = ( (pos[:, 0] < x_vox + ds/2.) &
+                         (pos[:, 0] > x_vox - ds/2.) &
+                         (pos[:, 1] < y_vox + ds/2.) &
+                         (pos[:, 1] > y_vox - ds/2.) &
+                         (pos[:, 2] < z_vox + ds/2.) &
+                         (pos[:, 2] > z_vox - ds/2.) )
+        vox_df = self.get_cell_df().iloc[np.sort(rows[inside_voxel])]
         return vox_df
 
-    def _read_xml(self, xml_file, output_path='.'):
+    def get_delta(self, other):
         """
-        Does the actual work of initializing MultiCellDS by parsing the xml
+        Compares this frame with a later one of the same run by cell ID.
+
+        Parameters
+        ----------
+        other : pyMCDS_cells
+            The later frame. Both frames need at least the ID and position
+            columns, the phase changes are only reported if cycle_model and
+            current_phase are loaded as well.
+
+        Returns
+        -------
+        delta : dict
+            'born' : IDs only present in other
+            'died' : IDs only present in this frame
+            'ID' : sorted IDs present in both frames
+            'rows' / 'other_rows' : row of each of those cells in this frame
+                and in other, e.g. to update just those cells on the GPU
+            'displacement' : array shape=[n_common, 3], position in other
+                minus position in this frame
+            'changed_cycle_model' / 'changed_phase' : IDs whose cycle_model /
+                current_phase differs between the two frames
+        """
+        cells = self.data['discrete_cells']
+        other_cells = other.data['discrete_cells']
+        ids = np.asarray(cells['ID'])
+        other_ids = np.asarray(other_cells['ID'])
+
+        common, rows, other_rows = np.intersect1d(
+            ids, other_ids, assume_unique=True, return_indices=True)
+
+        delta = {}
+        delta['born'] = np.setdiff1d(other_ids, ids, assume_unique=True)
+        delta['died'] = np.setdiff1d(ids, other_ids, assume_unique=True)
+        delta['ID'] = common
+        delta['rows'] = rows
+        delta['other_rows'] = other_rows
+        delta['displacement'] = other.get_cell_positions()[other_rows] \
+            - self.get_cell_positions()[rows]
+
+        for name, key in (('cycle_model', 'changed_cycle_model'),
+                          ('current_phase', 'changed_phase')):
+            if name in cells and name in other_cells:
+                changed = np.asarray(cells[name])[rows] != np.asarray(other_cells[name])[other_rows]
+                delta[key] = common[changed]
+
+        return delta
+
+    ## SPATIAL QUERIES
+
+    def get_cell_positions(self):
         """
+        Returns the cell positions as a single array, built once per frame.
 
-        output_path = Path(output_path)
-        xml_file = output_path / xml_file
-        tree = ET.parse(xml_file)
+        Returns
+        -------
+        xyz : array (np.float) shape=[n_cells, 3]
+        """
+        if self._cell_positions is None:
+            cells = self.data['discrete_cells']
+            self._cell_positions = np.column_stack(
+                [cells['position_x'], cells['position_y'], cells['position_z']])
+        return self._cell_positions
 
-        # print('Reading {}'.format(xml_file))
+    def get_voxel_cell_counts(self):
+        """
+        Returns the number of cells whose center lies in each voxel.
 
-        root = tree.getroot()
-        MCDS = {}
-
-        # Get current simulated time
-        metadata_node = root.find('metadata')
-        time_node = metadata_node.find('current_time')
-        MCDS['metadata'] = {}
-        MCDS['metadata']['current_time'] = float(time_node.text)
-        MCDS['metadata']['time_units'] = time_node.get('units')
-
-        # Get current runtime
-        time_node = metadata_node.find('current_runtime')
-        MCDS['metadata']['current_runtime'] = float(time_node.text)
-        MCDS['metadata']['runtime_units'] = time_node.get('units')
-
-        # # find the microenvironment node
-        # me_node = root.find('microenvironment')
-        # me_node = me_node.find('domain')
-
-        # # find the mesh node
-        # mesh_node = me_node.find('mesh')
-        # MCDS['metadata']['spatial_units'] = mesh_node.get('units')
-        # MCDS['mesh'] = {}
-
-        # # while we're at it, find the mesh
-        # coord_str = mesh_node.find('x_coordinates').text
-        # delimiter = mesh_node.find('x_coordinates').get('delimiter')
-        # x_coords = np.array(coord_str.split(delimiter), dtype=np.float)
-
-        # coord_str = mesh_node.find('y_coordinates').text
-        # delimiter = mesh_node.find('y_coordinates').get('delimiter')
-        # y_coords = np.array(coord_str.split(delimiter), dtype=np.float)
-
-        # coord_str = mesh_node.find('z_coordinates').text
-        # delimiter = mesh_node.find('z_coordinates').get('delimiter')
-        # z_coords = np.array(coord_str.split(delimiter), dtype=np.float)
-
-        # # reshape into a mesh grid
-        # xx, yy, zz = np.meshgrid(x_coords, y_coords, z_coords)
-
-        # MCDS['mesh']['x_coordinates'] = xx
-        # MCDS['mesh']['y_coordinates'] = yy
-        # MCDS['mesh']['z_coordinates'] = zz
-
-        # # Voxel data must be loaded from .mat file
-        # voxel_file = mesh_node.find('voxels').find('filename').text
-        # voxel_path = output_path / voxel_file
-        # try:
-        #     initial_mesh = sio.loadmat(voxel_path)['mesh']
-        # except:
-        #     raise FileNotFoundError(
-        #         "No such file or directory:\n'{}' referenced in '{}'".format(voxel_path, xml_file))
-        #     sys.exit(1)
-
-        # print('Reading {}'.format(voxel_path))
-
-        # # center of voxel specified by first three rows [ x, y, z ]
-        # # volume specified by fourth row
-        # MCDS['mesh']['voxels'] = {}
-        # MCDS['mesh']['voxels']['centers'] = initial_mesh[:3, :]
-        # MCDS['mesh']['voxels']['volumes'] = initial_mesh[3, :]
-
-        # # Continuum_variables, unlike in the matlab version the individual chemical
-        # # species will be primarily accessed through their names e.g.
-        # # MCDS['continuum_variables']['oxygen']['units']
-        # # MCDS['continuum_variables']['glucose']['data']
-        # MCDS['continuum_variables'] = {}
-        # variables_node = me_node.find('variables')
-        # file_node = me_node.find('data').find('filename')
-
-        # # micro environment data is shape [4+n, len(voxels)] where n is the number
-        # # of species being tracked. the first 3 rows represent (x, y, z) of voxel
-        # # centers. The fourth row contains the voxel volume. The 5th row and up will
-        # # contain values for that species in that voxel.
-        # me_file = file_node.text
-        # me_path = output_path / me_file
-        # # Changes here
-        # try:
-        #     me_data = sio.loadmat(me_path)['multiscale_microenvironment']
-        # except:
-        #     raise FileNotFoundError(
-        #         "No such file or directory:\n'{}' referenced in '{}'".format(me_path, xml_file))
-        #     sys.exit(1)
-
-        # print('Reading {}'.format(me_path))
-
-        # var_children = variables_node.findall('variable')
-
-        # # we're going to need the linear x, y, and z coordinates later
-        # # but we dont need to get them in the loop
-        # X, Y, Z = np.unique(xx), np.unique(yy), np.unique(zz)
-
-        # for si, species in enumerate(var_children):
-        #     species_name = species.get('name')
-        #     MCDS['continuum_variables'][species_name] = {}
-        #     MCDS['continuum_variables'][species_name]['units'] = species.get(
-        #         'units')
-
-        #     print('Parsing {:s} data'.format(species_name))
-
-        #     # initialize array for concentration data
-        #     MCDS['continuum_variables'][species_name]['data'] = np.zeros(xx.shape)
-
-        #     # travel down one level on tree
-        #     species = species.find('physical_parameter_set')
-
-        #     # diffusion data for each species
-        #     MCDS['continuum_variables'][species_name]['diffusion_coefficient'] = {}
-        #     MCDS['continuum_variables'][species_name]['diffusion_coefficient']['value'] \
-        #         = float(species.find('diffusion_coefficient').text)
-        #     MCDS['continuum_variables'][species_name]['diffusion_coefficient']['units'] \
-        #         = species.find('diffusion_coefficient').get('units')
-
-        #     # decay data for each species
-        #     MCDS['continuum_variables'][species_name]['decay_rate'] = {}
-        #     MCDS['continuum_variables'][species_name]['decay_rate']['value'] \
-        #         = float(species.find('decay_rate').text)
-        #     MCDS['continuum_variables'][species_name]['decay_rate']['units'] \
-        #         = species.find('decay_rate').get('units')
-
-        #     # store data from microenvironment file as numpy array            
-        #     # iterate over each voxel
-        #     for vox_idx in range(MCDS['mesh']['voxels']['centers'].shape[1]):
-        #         # find the center
-        #         center = MCDS['mesh']['voxels']['centers'][:, vox_idx]
-
-        #         i = np.where(np.abs(center[0] - X) < 1e-10)[0][0]
-        #         j = np.where(np.abs(center[1] - Y) < 1e-10)[0][0]
-        #         k = np.where(np.abs(center[2] - Z) < 1e-10)[0][0]
-
-        #         MCDS['continuum_variables'][species_name]['data'][j, i, k] \
-        #             = me_data[4+si, vox_idx]
-
-        # in order to get to the good stuff we have to pass through a few different
-        # hierarchal levels
-        cell_node = root.find('cellular_information')
-        cell_node = cell_node.find('cell_populations')
-        cell_node = cell_node.find('cell_population')
-        cell_node = cell_node.find('custom')
-        # we want the PhysiCell data, there is more of it
-        for child in cell_node.findall('simplified_data'):
-            if child.get('source') == 'PhysiCell':
-                cell_node = child
-                break
-
-        MCDS['discrete_cells'] = {}
-        data_labels = []
-        # iterate over 'label's which are children of 'labels' these will be used to
-        # label data arrays
-        for label in cell_node.find('labels').findall('label'):
-            # I don't like spaces in my dictionary keys
-            fixed_label = label.text.replace(' ', '_')
-            if int(label.get('size')) > 1:
-                # tags to differentiate repeated labels (usually space related)
-                dir_label = ['_x', '_y', '_z']
-                for i in range(int(label.get('size'))):
-                    data_labels.append(fixed_label + dir_label[i])
-            else:
-                data_labels.append(fixed_label)
+        Returns
+        -------
+        counts : array (np.int) shape=[ny_voxel, nx_voxel, nz_voxel]
+            Spatially maps to the meshgrid returned by get_mesh().
+        """
+        order, starts = self._get_voxel_index()
+        return np.diff(starts).reshape(self.data['mesh']['x_coordinates'].shape)
 
-        # load the file
-        cell_file = cell_node.find('filename').text
-        cell_path = output_path / cell_file
-        try:
-            cell_data = sio.loadmat(cell_path)['cells']
-        except:
-            raise FileNotFoundError(
-                "No such file or directory:\n'{}' referenced in '{}'".format(cell_path, xml_file))
-            sys.exit(1)
+    def get_cell_indices_at(self, xyz):
+        """
+        Batched voxel membership: for each point, returns the indices (rows of
+        get_cell_df()) of the cells whose center is in the same voxel. Cells
+        and points are assigned to the voxel with the nearest center, points
+        outside the mesh go to the closest boundary voxel.
 
-        # print('Reading {}'.format(cell_path))
+        Parameters
+        ----------
+        xyz : array, shape=[n_points, 3] or [3,]
+            Positions of interest
 
-        for col in range(len(data_labels)):
-            MCDS['discrete_cells'][data_labels[col]] = cell_data[col, :]
+        Returns
+        -------
+        indices : list (array) length=n_points, or array for a single point
+        """
+        points = np.atleast_2d(np.asarray(xyz, dtype=float))
+        order, starts = self._get_voxel_index()
+        flat = self._voxel_flat_index(points)
+        indices = [np.sort(order[starts[v]:starts[v + 1]]) for v in flat]
+        return indices[0] if np.ndim(xyz) == 1 else indices
 
-        return MCDS
+    def get_cells_within(self, xyz, radius):
+        """
+        Radius query: returns the indices (rows of get_cell_df()) of the cells
+        whose center is within radius of each point.
+
+        Parameters
+        ----------
+        xyz : array, shape=[n_points, 3] or [3,]
+            Positions of interest
+        radius : float
+            Search radius, in the same units as the cell positions
+
+        Returns
+        -------
+        indices : list (array) length=n_points, or array for a single point
+        """
+        points = np.atleast_2d(np.asarray(xyz, dtype=float))
+        found = self._get_kdtree().query_ball_point(points, radius)
+        indices = [np.sort(np.asarray(rows, dtype=np.intp)) for rows in found]
+        return indices[0] if np.ndim(xyz) == 1 else indices
+
+    def get_nearest_cells(self, xyz, k=1):
+        """
+        k-nearest neighbours: returns the distances to and indices (rows of
+        get_cell_df()) of the k cells closest to each point.
+
+        Parameters
+        ----------
+        xyz : array, shape=[n_points, 3] or [3,]
+            Positions of interest
+        k : int
+            Number of neighbours
+
+        Returns
+        -------
+        distances : array, shape=[n_points, k]
+        indices : array, shape=[n_points, k]
+            Points with fewer than k cells around get index n_cells and
+            distance inf for the missing neighbours.
+        """
+        points = np.atleast_2d(np.asarray(xyz, dtype=float))
+        distances, indices = self._get_kdtree().query(points, k=[i + 1 for i in range(k)])
+        if np.ndim(xyz) == 1:
+            return distances[0], indices[0]
+        return distances, indices
+
+    def _get_kdtree(self):
+        if self._kdtree is None:
+            from scipy.spatial import cKDTree
+            self._kdtree = cKDTree(self.get_cell_positions())
+        return self._kdtree
+
+    def _voxel_flat_index(self, points):
+        """
+        Flat index into the meshgrid of the voxel nearest to each point.
+        """
+        X, Y, Z = self._get_mesh_axes()
+        i = _nearest_index(X, points[:, 0])
+        j = _nearest_index(Y, points[:, 1])
+        k = _nearest_index(Z, points[:, 2])
+        return np.ravel_multi_index((j, i, k), (len(Y), len(X), len(Z)))
+
+    def _get_voxel_index(self):
+        """
+        Uniform grid index aligned with the BioFVM voxel mesh, built on first
+        use. Cells are sorted by voxel, so the cells of flat voxel v are
+        order[starts[v]:starts[v + 1]].
+        """
+        if self._voxel_index is None:
+            X, Y, Z = self._get_mesh_axes()
+            flat = self._voxel_flat_index(self.get_cell_positions())
+            order = np.argsort(flat, kind='stable')
+            starts = np.zeros(len(X) * len(Y) * len(Z) + 1, dtype=np.intp)
+            np.cumsum(np.bincount(flat, minlength=len(starts) - 1), out=starts[1:])
+            self._voxel_index = (order, starts)
+        return self._voxel_index
+
+    def _cells_around_voxel(self, i, j, k):
+        """
+        Indices of the cells binned into voxel (i, j, k) or any of the 26
+        voxels around it.
+        """
+        X, Y, Z = self._get_mesh_axes()
+        order, starts = self._get_voxel_index()
+        jj, ii, kk = np.meshgrid(np.arange(max(j - 1, 0), min(j + 2, len(Y))),
+                                 np.arange(max(i - 1, 0), min(i + 2, len(X))),
+                                 np.arange(max(k - 1, 0), min(k + 2, len(Z))),
+                                 indexing='ij')
+        flat = np.ravel_multi_index((jj.ravel(), ii.ravel(), kk.ravel()),
+                                    (len(Y), len(X), len(Z)))
+        return np.concatenate([order[starts[v]:starts[v + 1]] for v in flat])
+
+    def _get_mesh_axes(self):
+        """
+        1-D voxel center coordinates along x, y and z.
+        """
+        self.data['mesh']
+        return self._reader._mesh_axes
+
+    ## PROFILING
+
+    def get_profile(self):
+        """
+        Returns the loading stages recorded so far, see the profile
+        argument. Stages nest: read_xml includes parse_xml. Lazily loaded
+        data adds records as it is first used.
+
+        Returns
+        -------
+        records : list (dict)
+            One dict per stage run, with 'xml_file', 'stage', 'seconds' and
+            'bytes' (bytes read from disk or materialized, 0 if not tracked)
+        """
+        if self._profile is None:
+            raise RuntimeError('Profiling is off, construct pyMCDS_cells with '
+                               'profile=True or set {}=1'.format(_PROFILE_ENV))
+        return list(self._profile)
+
+    def get_profile_summary(self):
+        """
+        Returns get_profile() added up per stage, see summarize_profile.
+        """
+        return summarize_profile(self.get_profile())
+
+    def _record_stage(self, stage, seconds, n_bytes):
+        self._reader._record_stage(stage, seconds, n_bytes)
+
+    def _load_columns_into(self, buffers):
+        """
+        Materializes every selected column into caller owned arrays, see
+        _FrameReader._load_columns_into.
+        """
+        self._reader._load_columns_into(self.data['discrete_cells'], buffers)
@@ -0,0 +1,215 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pyMCDS_cells import pyMCDS_cells, scan_output_dir, _select_labels
+from pyMCDS_timeseries import iter_frames
+
+# name of the index written next to the exported frames
+_INDEX_FILE = 'frames.json'
+_PARQUET_FILE = 'cells.parquet'
+
+
+def export_run(output_path='.', dest='export', format='npy', pattern='output*.xml'):
+    """
+    Exports every frame of a PhysiCell run as one long table of cells, with
+    the frame index, the simulated time and all of the labelled cell
+    variables as columns. Frames are converted and written one at a time, so
+    memory use does not grow with the length of the run.
+
+    Two layouts are supported:
+
+    'npy'     one directory per frame holding one .npy file per cell
+              variable, the same layout as the pyMCDS_cells columnar cache.
+              Frames that were already exported and whose source files have
+              not changed are not converted again. open_exported_frame()
+              reads the frames back as pyMCDS_cells objects.
+    'parquet' a single Parquet file with one row group per frame, which
+              lets readers skip frames using the row group statistics.
+              Requires pyarrow.
+
+    Both layouts also get a frames.json index listing the frames, their
+    times, cell counts and first row in the long table.
+
+    Parameters
+    ----------
+    output_path : str, optional
+        Directory where the PhysiCell output files are stored (default= ".")
+    dest : str, optional
+        Directory to write the export to (default= "export")
+    format : str, optional
+        'npy' or 'parquet' (default= 'npy')
+    pattern : str, optional
+        Glob pattern selecting the frame xml files (default= "output*.xml")
+
+    Returns
+    -------
+    index : dict
+        Contents of the frames.json index
+    """
+    if format not in ('npy', 'parquet'):
+        raise ValueError("format must be 'npy' or 'parquet', not {!r}".format(format))
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    frames = scan_output_dir(output_path, pattern)
+
+    if format == 'npy':
+        labels = _export_npy(output_path, dest, frames)
+    else:
+        labels = _export_parquet(output_path, dest, frames, pattern)
+
+    index = {'format': format, 'labels': labels, 'frames': []}
+    row_offset = 0
+    for idx, info in enumerate(frames):
+        index['frames'].append({'frame': idx,
+                                'xml_file': info['xml_file'],
+                                'current_time': info['current_time'],
+                                'n_cells': info['n_cells'],
+                                'row_offset': row_offset})
+        row_offset += info['n_cells']
+
+    tmp_path = dest / (_INDEX_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, dest / _INDEX_FILE)
+    return index
+
+
+def _export_npy(output_path, dest, frames):
+    labels = []
+    for info in frames:
+        # constructing the frame with the export as its cache writes (or
+        # validates) the frame's entry, nothing else is loaded
+        mcds = pyMCDS_cells(info['xml_file'], output_path, cache=dest)
+        if not labels:
+            labels = mcds.get_cell_variables()
+    return labels
+
+
+def _export_parquet(output_path, dest, frames, pattern):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("format='parquet' requires pyarrow, use format='npy' "
+                          "or install pyarrow")
+
+    writer = None
+    labels = []
+    parquet_path = dest / _PARQUET_FILE
+    tmp_path = dest / (_PARQUET_FILE + '.tmp')
+    try:
+        for idx, mcds in enumerate(iter_frames(output_path, pattern=pattern)):
+            cells = mcds.data['discrete_cells']
+            n_cells = len(cells['ID'])
+            if writer is None:
+                labels = list(cells)
+            elif list(cells) != labels:
+                raise ValueError('{} does not have the same cell variables as the '
+                                 'first frame'.format(frames[idx]['xml_file']))
+
+            columns = {'frame': np.full(n_cells, idx, dtype=np.int32),
+                       'time': np.full(n_cells, mcds.get_time())}
+            for label in labels:
+                columns[label] = np.asarray(cells[label])
+            table = pa.table(columns)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table, row_group_size=max(n_cells, 1))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is not None:
+        os.replace(tmp_path, parquet_path)
+    return labels
+
+
+def read_export_index(dest):
+    """
+    Returns the frames.json index of an exported run.
+    """
+    with open(Path(dest) / _INDEX_FILE) as f:
+        return json.load(f)
+
+
+def open_exported_frame(dest, frame, **kwargs):
+    """
+    Opens one frame of a run exported with format='npy' as a pyMCDS_cells
+    object, without needing the original output files. Only the cell data
+    is exported, the mesh and substrates are not available.
+
+    Parameters
+    ----------
+    dest : str
+        Directory the run was exported to
+    frame : int or str
+        Index of the frame in time order, or the name of its xml file
+    **kwargs
+        Passed on to pyMCDS_cells, e.g. columns, compact or cell_filter
+
+    Returns
+    -------
+    mcds : pyMCDS_cells
+    """
+    index = read_export_index(dest)
+    if index['format'] != 'npy':
+        raise ValueError("Only format='npy' exports can be opened as frames, "
+                         "use read_exported_table for {}".format(index['format']))
+    xml_file = frame
+    if not isinstance(frame, str):
+        xml_file = index['frames'][frame]['xml_file']
+    return pyMCDS_cells(xml_file, dest, cache=dest, **kwargs)
+
+
+def read_exported_table(dest, columns=None, frames=None):
+    """
+    Reads (part of) the long cell table of an exported run.
+
+    Parameters
+    ----------
+    dest : str
+        Directory the run was exported to
+    columns : list (str), optional
+        Cell variables to read, vector variables may be given by their base
+        name. 'frame' and 'time' are always included (default= None, all)
+    frames : list (int), optional
+        Frame indices to read, the others are skipped without being read
+        (default= None, all)
+
+    Returns
+    -------
+    cells_df : pd.DataFrame, shape=[n_rows, n_columns]
+    """
+    index = read_export_index(dest)
+    selected = index['frames']
+    if frames is not None:
+        frames = set(frames)
+        selected = [info for info in selected if info['frame'] in frames]
+
+    if index['format'] == 'parquet':
+        import pyarrow.parquet as pq
+
+        read_columns = None
+        if columns is not None:
+            read_columns = ['frame', 'time'] + _select_labels(index['labels'], columns)
+        filters = None
+        if frames is not None:
+            filters = [('frame', 'in', sorted(frames))]
+        table = pq.read_table(Path(dest) / _PARQUET_FILE, columns=read_columns,
+                              filters=filters)
+        return table.to_pandas()
+
+    parts = []
+    for info in selected:
+        mcds = open_exported_frame(dest, info['xml_file'], columns=columns)
+        cells_df = mcds.get_cell_df()
+        cells_df.insert(0, 'time', info['current_time'])
+        cells_df.insert(0, 'frame', np.int32(info['frame']))
+        parts.append(cells_df)
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,283 @@
+import sys
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from pyMCDS_cells import pyMCDS_cells, scan_output_dir
+
+
+class pyMCDS_timeseries:
+    """
+    This class indexes all of the output frames of a single PhysiCell run and
+    hands out pyMCDS_cells objects for them. Frames are sorted by simulated
+    time, loaded on a thread pool and kept in a bounded least recently used
+    cache. Every time a frame is requested, the next few frames in the
+    direction the caller is moving through the run are loaded in the
+    background.
+
+    Parameters
+    ----------
+    output_path: str, optional
+        String containing the path (relative or absolute) to the directory
+        where PhysiCell output files are stored (default= ".")
+    pattern: str, optional
+        Glob pattern selecting the frame xml files (default= "output*.xml")
+    max_cached: int, optional
+        Maximum number of frames kept alive, including the ones being read
+        ahead (default= 8)
+    read_ahead: int, optional
+        Number of frames loaded ahead of the last requested one (default= 2)
+    workers: int, optional
+        Number of loader threads (default= 4)
+    **kwargs
+        Passed on to pyMCDS_cells for every frame, e.g. columns, cache or
+        microenv.
+
+    Attributes
+    ----------
+    frames : list (dict)
+        read_frame_info() dict for each frame, in time order
+    """
+    def __init__(self, output_path='.', pattern='output*.xml', max_cached=8,
+                 read_ahead=2, workers=4, **kwargs):
+        self.output_path = Path(output_path)
+        self.frames = scan_output_dir(output_path, pattern)
+        self._kwargs = kwargs
+        self._max_cached = max(1, max_cached)
+        self._read_ahead = max(0, min(read_ahead, self._max_cached - 1))
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._cache = OrderedDict()
+        self._last_idx = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, idx):
+        return self.get_frame(idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.get_frame(idx)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Stops the loader threads and drops all cached frames.
+        """
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._cache.clear()
+
+    ## METADATA RELATED FUNCTIONS
+
+    def get_times(self):
+        """
+        Returns the simulated time of each frame, in time order.
+
+        Returns
+        -------
+        times : array (np.float) shape=[n_frames,]
+        """
+        return np.array([info['current_time'] for info in self.frames])
+
+    def get_xml_files(self):
+        """
+        Returns the xml file name of each frame, in time order.
+        """
+        return [info['xml_file'] for info in self.frames]
+
+    def get_cell_counts(self):
+        """
+        Returns the number of cells in each frame, in time order, without
+        loading any of them.
+
+        Returns
+        -------
+        counts : array (np.int) shape=[n_frames,]
+        """
+        return np.array([info['n_cells'] for info in self.frames])
+
+    ## FRAME RELATED FUNCTIONS
+
+    def get_frame(self, idx):
+        """
+        Returns the pyMCDS_cells object for one frame and schedules read-ahead
+        of the frames following it in the direction of travel.
+
+        Parameters
+        ----------
+        idx : int
+            Index of the frame in time order, negative values count from the
+            end.
+
+        Returns
+        -------
+        mcds : pyMCDS_cells
+        """
+        n_frames = len(self.frames)
+        if idx < 0:
+            idx += n_frames
+        if not 0 <= idx < n_frames:
+            raise IndexError('frame index {} out of range for {} frames'.format(
+                idx, n_frames))
+
+        future = self._submit(idx)
+        self._cache.move_to_end(idx)
+
+        step = 1
+        if self._last_idx is not None and idx < self._last_idx:
+            step = -1
+        self._last_idx = idx
+        for ahead in range(1, self._read_ahead + 1):
+            nxt = idx + step * ahead
+            if 0 <= nxt < n_frames:
+                self._submit(nxt)
+                self._cache.move_to_end(nxt)
+
+        self._evict(keep=idx)
+        return future.result()
+
+    def get_frame_at_time(self, time):
+        """
+        Returns the frame whose simulated time is closest to time.
+        """
+        return self.get_frame(int(np.argmin(np.abs(self.get_times() - time))))
+
+    def get_delta(self, idx):
+        """
+        Returns the births, deaths, phase changes and displacements from
+        frame idx to frame idx + 1, see pyMCDS_cells.get_delta.
+        """
+        if idx < 0:
+            idx += len(self.frames)
+        return self.get_frame(idx).get_delta(self.get_frame(idx + 1))
+
+    def _submit(self, idx):
+        future = self._cache.get(idx)
+        if future is None:
+            future = self._pool.submit(self._load, idx)
+            self._cache[idx] = future
+        return future
+
+    def _evict(self, keep):
+        while len(self._cache) > self._max_cached:
+            for old_idx in self._cache:
+                if old_idx != keep:
+                    self._cache.pop(old_idx).cancel()
+                    break
+
+    def _load(self, idx):
+        mcds = pyMCDS_cells(self.frames[idx]['xml_file'], self.output_path,
+                            **self._kwargs)
+        # materialize the selected columns here rather than on the caller's
+        # thread
+        cells = mcds.data['discrete_cells']
+        for name in cells:
+            cells[name]
+        return mcds
+
+
+def _buffers_in_use(buffers):
+    """
+    Tells whether anything besides the dict refers to one of the buffers.
+    Every view of a buffer, however derived, keeps a reference to it.
+    """
+    # the count of an array only a dict refers to, taken the same way
+    probe = {None: np.empty(0)}
+    unshared = sys.getrefcount(probe[None])
+    return any(sys.getrefcount(buffers[name]) > unshared for name in buffers)
+
+
+def iter_frames(output_path='.', columns=None, max_resident=2, pattern='output*.xml',
+                reuse_buffers=True, **kwargs):
+    """
+    Streams the frames of a run in time order while keeping at most
+    max_resident of them decoded at once: the one the caller is working on
+    plus up to max_resident - 1 being read ahead on background threads, so
+    the I/O for the next frames overlaps with whatever the caller does with
+    the current one. With max_resident=1 nothing is read ahead, the next
+    frame is read when the caller asks for it. The frame a for loop variable
+    still refers to is only released once the next one has been handed out,
+    so for that moment there is one more.
+
+    The selected columns are copied into a fixed set of buffers, one per
+    resident frame plus one for that previous frame, which are reused from
+    frame to frame rather than reallocated. A buffer is only recycled once
+    nothing refers to it any more, neither the frame nor a column, a slice of
+    one or a DataFrame built from them, so whatever the caller keeps from a
+    frame stays valid, it just stops sharing memory with the stream.
+
+    Parameters
+    ----------
+    output_path: str, optional
+        String containing the path (relative or absolute) to the directory
+        where PhysiCell output files are stored (default= ".")
+    columns: list (str), optional
+        Cell variables to load for every frame, see pyMCDS_cells (default=
+        None, all of them)
+    max_resident: int, optional
+        Maximum number of decoded frames alive at any time (default= 2)
+    pattern: str, optional
+        Glob pattern selecting the frame xml files (default= "output*.xml")
+    reuse_buffers: bool, optional
+        If False, every frame gets freshly allocated columns (default= True)
+    **kwargs
+        Passed on to pyMCDS_cells for every frame, e.g. cache or compact.
+
+    Yields
+    ------
+    mcds : pyMCDS_cells
+        One frame at a time, with its selected columns already loaded.
+    """
+    frames = scan_output_dir(output_path, pattern)
+    max_resident = max(1, max_resident)
+    n_slots = max_resident + 1
+    buffers = [{} for _ in range(n_slots)]
+
+    def load(idx):
+        mcds = pyMCDS_cells(frames[idx]['xml_file'], output_path,
+                            columns=columns, **kwargs)
+        if not reuse_buffers:
+            cells = mcds.data['discrete_cells']
+            for name in cells:
+                cells[name]
+            return mcds
+
+        # frame idx - n_slots used this slot before. The stream has let go
+        # of it by now, but the caller may still hold on to it or to some of
+        # its columns, which are views of the buffers
+        slot = idx % n_slots
+        if _buffers_in_use(buffers[slot]):
+            buffers[slot] = {}
+        mcds._load_columns_into(buffers[slot])
+        return mcds
+
+    def submit_next():
+        nonlocal next_idx
+        pending.append(pool.submit(load, next_idx))
+        next_idx += 1
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_resident - 1))
+    pending = deque()
+    next_idx = 0
+    try:
+        if frames:
+            submit_next()
+        while pending:
+            mcds = pending.popleft().result()
+            # read ahead before handing the frame out, so the next ones load
+            # while the caller works on this one
+            while next_idx < len(frames) and len(pending) < max_resident - 1:
+                submit_next()
+            yield mcds
+            del mcds
+            if not pending and next_idx < len(frames):
+                submit_next()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
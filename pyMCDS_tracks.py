@@ -0,0 +1,133 @@
+import numpy as np
+
+from pyMCDS_cells import _select_labels
+from pyMCDS_timeseries import pyMCDS_timeseries
+
+
+class pyMCDS_tracks:
+    """
+    This class follows every cell of a PhysiCell run across its output frames
+    by joining on the cell ID. Per-cell trajectories are stored as ragged
+    arrays: all samples of all cells are concatenated, sorted by ID and then
+    by time, and offsets[n]:offsets[n + 1] selects the samples of the cell
+    ids[n].
+
+    Parameters
+    ----------
+    output_path: str, optional
+        String containing the path (relative or absolute) to the directory
+        where PhysiCell output files are stored (default= ".")
+    columns: list (str), optional
+        Cell variables to follow, vector variables may be given by their base
+        name (default= ['position', 'current_phase', 'oncoprotein'])
+    pattern: str, optional
+        Glob pattern selecting the frame xml files (default= "output*.xml")
+    **kwargs
+        Passed on to pyMCDS_timeseries, e.g. workers, cache or compact.
+
+    Attributes
+    ----------
+    ids : array (np.int64) shape=[n_cells,]
+        Sorted IDs of every cell seen in the run
+    offsets : array (np.intp) shape=[n_cells + 1,]
+        Start of each cell's samples in the ragged arrays
+    frame : array (np.int32) shape=[n_samples,]
+        Frame index of each sample
+    time : array (np.float) shape=[n_samples,]
+        Simulated time of each sample
+    data : dict
+        Ragged array of each followed cell variable, shape=[n_samples,]
+    """
+    def __init__(self, output_path='.', columns=('position', 'current_phase', 'oncoprotein'),
+                 pattern='output*.xml', **kwargs):
+        columns = list(columns)
+        series = pyMCDS_timeseries(output_path, pattern=pattern,
+                                   columns=['ID'] + columns, **kwargs)
+        with series:
+            times = series.get_times()
+            ids, frames, values = [], [], {}
+            for idx in range(len(series)):
+                cells = series[idx].data['discrete_cells']
+                ids.append(np.asarray(cells['ID']).astype(np.int64))
+                frames.append(np.full(ids[-1].shape[0], idx, dtype=np.int32))
+                for name in cells:
+                    if name != 'ID':
+                        values.setdefault(name, []).append(np.asarray(cells[name]))
+
+        ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        frame = np.concatenate(frames) if frames else np.zeros(0, dtype=np.int32)
+
+        # sort by ID, then by frame, and cut into one run per ID
+        order = np.lexsort((frame, ids))
+        ids = ids[order]
+        self.ids, starts = np.unique(ids, return_index=True)
+        self.offsets = np.append(starts, ids.shape[0]).astype(np.intp)
+        self.frame = frame[order]
+        self.time = times[self.frame] if len(times) else np.zeros(0)
+        self.data = {name: np.concatenate(parts)[order] for name, parts in values.items()}
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    def __contains__(self, cell_id):
+        return self._find(cell_id) is not None
+
+    def get_cell_variables(self):
+        """
+        Returns the names of the cell variables being followed.
+        """
+        return list(self.data)
+
+    def get_track_lengths(self):
+        """
+        Returns the number of frames each cell appears in.
+
+        Returns
+        -------
+        lengths : array (np.intp) shape=[n_cells,]
+            In the order of ids
+        """
+        return np.diff(self.offsets)
+
+    def get_trajectory(self, cell_id):
+        """
+        Returns everything recorded about one cell, in time order.
+
+        Parameters
+        ----------
+        cell_id : int
+            ID of the cell
+
+        Returns
+        -------
+        trajectory : dict
+            'frame', 'time' and one array per followed cell variable, all of
+            shape [n_frames_alive,]. These are views of the ragged arrays.
+        """
+        n = self._find(cell_id)
+        if n is None:
+            raise KeyError('No cell with ID {}'.format(cell_id))
+
+        rows = slice(self.offsets[n], self.offsets[n + 1])
+        trajectory = {'frame': self.frame[rows], 'time': self.time[rows]}
+        for name, values in self.data.items():
+            trajectory[name] = values[rows]
+        return trajectory
+
+    def get_positions(self, cell_id):
+        """
+        Returns the positions of one cell over time.
+
+        Returns
+        -------
+        xyz : array (np.float) shape=[n_frames_alive, 3]
+        """
+        trajectory = self.get_trajectory(cell_id)
+        return np.column_stack([trajectory[name] for name in
+                                _select_labels(list(self.data), ['position'])])
+
+    def _find(self, cell_id):
+        n = np.searchsorted(self.ids, cell_id)
+        if n < self.ids.shape[0] and self.ids[n] == cell_id:
+            return int(n)
+        return None
@@ -0,0 +1,152 @@
+# Compute per-frame population statistics for every frame of a PhysiCell run
+# and write them to a single CSV file, one row per frame.
+#
+#   python tumor_stats.py output -o stats.csv
+#   python tumor_stats.py . --pattern 'output*.xml' --workers 8
+#
+# Frames are processed in parallel worker processes.
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from pyMCDS_cells import pyMCDS_cells, scan_output_dir
+
+_STAT_COLUMNS = ['position', 'total_volume', 'cell_type', 'cycle_model']
+
+
+def frame_stats(xml_file, output_path='.', cache=False):
+    """
+    Computes the population statistics of a single frame.
+
+    Cells are live if cycle_model < 100, apoptotic if cycle_model == 100 and
+    necrotic if cycle_model > 100. The spheroid radius is measured from the
+    centroid of all cells in two ways: the distance to the farthest cell, and
+    the radius of the uniformly filled sphere with the same radius of
+    gyration, which is much less sensitive to a few stray cells.
+
+    Parameters
+    ----------
+    xml_file : str
+        Name of the xml file without the path
+    output_path : str, optional
+        Directory where the PhysiCell output files are stored (default= ".")
+    cache : bool, optional
+        Passed on to pyMCDS_cells (default= False)
+
+    Returns
+    -------
+    stats : dict
+        'xml_file', 'time', 'n_cells', 'n_live', 'n_apoptotic',
+        'n_necrotic', 'total_volume', 'radius_max', 'radius_gyration' and,
+        for every cell type t present, 'n_type_t' and 'n_type_t_live'
+    """
+    mcds = pyMCDS_cells(xml_file, output_path, columns=_STAT_COLUMNS, cache=cache)
+    cells = mcds.data['discrete_cells']
+    cycle_model = cells['cycle_model']
+    cell_type = cells['cell_type']
+    live = cycle_model < 100
+
+    stats = {
+        'xml_file': xml_file,
+        'time': mcds.get_time(),
+        'n_cells': cycle_model.shape[0],
+        'n_live': int(np.count_nonzero(live)),
+        'n_apoptotic': int(np.count_nonzero(cycle_model == 100)),
+        'n_necrotic': int(np.count_nonzero(cycle_model > 100)),
+        'total_volume': float(np.sum(cells['total_volume'])),
+        'radius_max': 0.,
+        'radius_gyration': 0.,
+    }
+
+    types, counts = np.unique(cell_type, return_counts=True)
+    live_counts = np.bincount(np.searchsorted(types, cell_type[live]),
+                              minlength=types.shape[0])
+    for t, count, live_count in zip(types, counts, live_counts):
+        stats['n_type_{}'.format(int(t))] = int(count)
+        stats['n_type_{}_live'.format(int(t))] = int(live_count)
+
+    if cycle_model.shape[0]:
+        xyz = mcds.get_cell_positions()
+        dist2 = np.sum((xyz - xyz.mean(axis=0)) ** 2, axis=1)
+        stats['radius_max'] = float(np.sqrt(dist2.max()))
+        # <r^2> = 3/5 R^2 for a uniformly filled sphere of radius R
+        stats['radius_gyration'] = float(np.sqrt(dist2.mean() * 5. / 3.))
+    return stats
+
+
+def run_stats(output_path='.', pattern='output*.xml', workers=None, cache=False):
+    """
+    Runs frame_stats over every frame of a run in worker processes.
+
+    Parameters
+    ----------
+    output_path : str, optional
+        Directory where the PhysiCell output files are stored (default= ".")
+    pattern : str, optional
+        Glob pattern selecting the frame xml files (default= "output*.xml")
+    workers : int, optional
+        Number of worker processes (default= None, one per CPU)
+    cache : bool, optional
+        Passed on to pyMCDS_cells (default= False)
+
+    Returns
+    -------
+    stats_df : pd.DataFrame, shape=[n_frames, n_stats]
+        One row per frame in time order. Cell type counts are 0 for the
+        frames a type does not appear in.
+    """
+    xml_files = [info['xml_file'] for info in scan_output_dir(output_path, pattern)]
+    if not xml_files:
+        return pd.DataFrame()
+
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(xml_files))
+    chunksize = max(1, len(xml_files) // (4 * workers))
+    n = len(xml_files)
+    if workers == 1:
+        rows = [frame_stats(xml_file, output_path, cache) for xml_file in xml_files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(frame_stats, xml_files, [output_path] * n,
+                                 [cache] * n, chunksize=chunksize))
+
+    stats_df = pd.DataFrame(rows)
+    type_columns = [col for col in stats_df.columns if col.startswith('n_type_')]
+    stats_df[type_columns] = stats_df[type_columns].fillna(0).astype(int)
+    return stats_df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Per-frame cell counts, total volume and spheroid radius '
+                    'for every frame of a PhysiCell run.')
+    parser.add_argument('output_path', nargs='?', default='.',
+                        help='directory with the PhysiCell output files (default: .)')
+    parser.add_argument('-o', '--output', default='tumor_stats.csv',
+                        help='CSV file to write (default: tumor_stats.csv)')
+    parser.add_argument('--pattern', default='output*.xml',
+                        help='glob pattern selecting the frame xml files '
+                             '(default: output*.xml)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--cache', action='store_true',
+                        help='read and fill the columnar frame cache')
+    args = parser.parse_args(argv)
+
+    stats_df = run_stats(args.output_path, args.pattern, args.workers, args.cache)
+    if stats_df.empty:
+        print('No frames matching {} in {}'.format(args.pattern, args.output_path),
+              file=sys.stderr)
+        return 1
+    stats_df.to_csv(args.output, index=False)
+    print('Wrote {} frames to {}'.format(len(stats_df), args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,8 @@
 
 from pyMCDS_cells import pyMCDS_cells
 import numpy as np
+from cell_colors import colorize, Ramp, ONCOPROTEIN_SCHEME
+from cutaway import Cutaway, Plane, build_cutaway_panel
 from fury import window, actor, ui
 
 #mcds = pyMCDS_cells('output00000001.xml','data')
@@ -32,22 +34,12 @@ print(mcds.data['discrete_cells'].keys())
 #   sval = 2   # necrotic: brownish
 
 ncells = len(mcds.data['discrete_cells']['ID'])
-print('num cells originally = ',ncells)
+print('num cells = ', ncells)
 
-#xyz = np.empty((ncells,3))
-xyz = np.zeros((ncells,3))
 xvals = mcds.data['discrete_cells']['position_x']
 yvals = mcds.data['discrete_cells']['position_y']
 zvals = mcds.data['discrete_cells']['position_z']
 
-# lets just extract half of the spheroid of tumor cells
-idx_keep = np.where(zvals < 0.0)
-ncells = len(idx_keep[0])
-print("num cells after crop = ", ncells)
-xvals = xvals[idx_keep]
-yvals = yvals[idx_keep]
-zvals = zvals[idx_keep]
-
 xyz =np.transpose(np.array([xvals,yvals,zvals]))
 
 # sphere V = 4/3 * pi * r^3
@@ -55,10 +47,8 @@ xyz =np.transpose(np.array([xvals,yvals,zvals]))
 # r = np.cbrt(r3)
 cell_radii = mcds.data['discrete_cells']['total_volume'] * 0.75 / np.pi
 cell_radii = np.cbrt(cell_radii)
-cell_radii = cell_radii[idx_keep]
 
 cell_type = mcds.data['discrete_cells']['cell_type']
-cell_type = cell_type[idx_keep]
 print('cell_type min, max= ',cell_type.min(),cell_type.max())
 #print(cell_type)
 #cd8 = np.where(cell_type == 3.0)
@@ -68,50 +58,32 @@ print('cell_type min, max= ',cell_type.min(),cell_type.max())
 #num_cd8 = np.zeros(n)
 #num_neut = np.zeros(n)
 
-rgb = np.zeros((ncells,3))
-# default color: yellow
-rgb[:,0] = 1
-rgb[:,1] = 1
-rgb[:,2] = 0
 cell_phase = mcds.data['discrete_cells']['current_phase']
-cell_phase = cell_phase[idx_keep]
-
-cycle_model = mcds.data['discrete_cells']['cycle_model']
-cycle_model = cycle_model[idx_keep]
-
-cell_type = mcds.data['discrete_cells']['cell_type']
-cell_type = cell_type[idx_keep]
 
 onco = mcds.data['discrete_cells']['oncoprotein']
-onco = onco[idx_keep]
-onco_min = onco.min()
 print('onco min, max= ',onco.min(),onco.max())
-onco_range = onco.max() - onco.min()
 
 print('cell_phase min, max= ',cell_phase.min(),cell_phase.max())  # e.g., 14.0 100.0
 
+# lets just show half of the spheroid of tumor cells (z < 0). The cells with
+# z > 0 are cut away in the shader, so the sliders can move, tilt or change
+# the cut without touching the data. Other cuts, e.g. to look into the
+# necrotic core:
+#   center = xyz.mean(axis=0)
+#   cut = Wedge(center, (0, 0, 1), 0, 90) - Ball(center, 150)
+cut = Plane((0, 0, 1), 0.0)
+cutaway = Cutaway(cut)
+shown = cutaway.visible(xyz)
+print("num cells shown = ", np.count_nonzero(shown))
+
+# the oncoprotein ramp spans the cells shown by default, not the whole spheroid
+onco_range = onco[shown].min(), onco[shown].max()
+scheme = [(rule, Ramp(color.column, color.start, color.end, *onco_range))
+          if isinstance(color, Ramp) else (rule, color)
+          for rule, color in ONCOPROTEIN_SCHEME]
+
 # This coloring is only approximately correct, but at least it shows variation in cell colors
-for idx in range(ncells):
-    if cell_type[idx] == 1:
-        rgb[idx,0] = 1
-        rgb[idx,1] = 1
-        rgb[idx,2] = 0
-        # self.yval1 = np.array( [(np.count_nonzero((mcds[idx].data['discrete_cells']['cell_type'] == 1) & (mcds[idx].data['discrete_cells']['cycle_model'] < 100) == True)) for idx in range(ds_count)] )
-    if cycle_model[idx] < 100:
-        # rgb[idx,0] = 0.5
-        # rgb[idx,1] = 0.5
-        rgb[idx,0] = 1.0 - (onco[idx] - onco_min)/onco_range
-        # rgb[idx,1] = (onco[idx] - onco_min)/onco_range
-        rgb[idx,1] = rgb[idx,0]
-        rgb[idx,2] = 0
-    elif cycle_model[idx] == 100:
-        rgb[idx,0] = 1
-        rgb[idx,1] = 0
-        rgb[idx,2] = 0
-    elif cycle_model[idx] > 100:
-        rgb[idx,0] = 0.54   # 139./255
-        rgb[idx,1] = 0.27   # 69./255
-        rgb[idx,2] = 0.075  # 19./255
+rgb = colorize(mcds.data['discrete_cells'], scheme)
 
 #-----------------------------
 scene = window.Scene()
@@ -121,11 +93,13 @@ colors = (1,0,0)
 #sphere_actor = actor.sphere(centers=xyz, colors=colors, radii=1.0)
 #sphere_actor = actor.sphere(centers=xyz, colors=colors, radii=cell_radii)
 sphere_actor = actor.sphere(centers=xyz, colors=rgb, radii=cell_radii)
+cutaway.attach(sphere_actor, xyz)
 scene.add(sphere_actor)
 showm = window.ShowManager(scene,
                            size=(800, 800), reset_camera=True,
                            order_transparent=False)
 showm.initialize()
+scene.add(build_cutaway_panel(cutaway, extent=np.linalg.norm(xyz, axis=1).max()))
 showm.start()
 
 ## window.record(showm.scene, size=(900, 768), out_path="viz_timer.png")
@@ -3,8 +3,9 @@
 #
 # Randy Heiland
 
-from pyMCDS_cells import pyMCDS_cells
+from pyMCDS_cells import pyMCDS_cells, CellFilter, read_frame_info
 import numpy as np
+from cell_colors import colorize, LIVE_DEAD_SCHEME
 from fury import window, actor, ui
 
 #mcds = pyMCDS_cells('output00000001.xml','data')
@@ -13,7 +14,10 @@ from fury import window, actor, ui
 
 # Mar 4, '23
 #mcds = pyMCDS_cells('output00000013.xml','.')   # my old tumor data
-mcds = pyMCDS_cells('output00000080.xml','.')  # Heber's new 3D data (using MCDS v2)
+# lets just extract half of the spheroid of tumor cells (z < 0). The filter
+# is applied while the cells are read, so the other half is never copied
+half = CellFilter(half_space=((0, 0, 1), 0.0))
+mcds = pyMCDS_cells('output00000080.xml','.', cell_filter=half)  # Heber's new 3D data (using MCDS v2)
 
 tmins = mcds.get_time()
 print('time (mins)=',tmins)
@@ -36,23 +40,14 @@ print(mcds.data['discrete_cells'].keys())
 # if val[7,idx] > 100 and val[7,idx] < 104:
 #   sval = 2   # necrotic: brownish
 
+print('num cells originally = ',read_frame_info('output00000080.xml','.')['n_cells'])
 ncells = len(mcds.data['discrete_cells']['ID'])
-print('num cells originally = ',ncells)
+print("num cells after crop = ", ncells)
 
-#xyz = np.empty((ncells,3))
-xyz = np.zeros((ncells,3))
 xvals = mcds.data['discrete_cells']['position_x']
 yvals = mcds.data['discrete_cells']['position_y']
 zvals = mcds.data['discrete_cells']['position_z']
 
-# lets just extract half of the spheroid of tumor cells
-idx_keep = np.where(zvals < 0.0)
-ncells = len(idx_keep[0])
-print("num cells after crop = ", ncells)
-xvals = xvals[idx_keep]
-yvals = yvals[idx_keep]
-zvals = zvals[idx_keep]
-
 xyz =np.transpose(np.array([xvals,yvals,zvals]))
 
 # sphere V = 4/3 * pi * r^3
@@ -60,10 +55,8 @@ xyz =np.transpose(np.array([xvals,yvals,zvals]))
 # r = np.cbrt(r3)
 cell_radii = mcds.data['discrete_cells']['total_volume'] * 0.75 / np.pi
 cell_radii = np.cbrt(cell_radii)
-cell_radii = cell_radii[idx_keep]
 
 cell_type = mcds.data['discrete_cells']['cell_type']
-cell_type = cell_type[idx_keep]
 print('cell_type min, max= ',cell_type.min(),cell_type.max())
 #print(cell_type)
 #cd8 = np.where(cell_type == 3.0)
@@ -73,52 +66,12 @@ print('cell_type min, max= ',cell_type.min(),cell_type.max())
 #num_cd8 = np.zeros(n)
 #num_neut = np.zeros(n)
 
-rgb = np.zeros((ncells,3))
-# default color: yellow
-rgb[:,0] = 1
-rgb[:,1] = 1
-rgb[:,2] = 0
 cell_phase = mcds.data['discrete_cells']['current_phase']
-cell_phase = cell_phase[idx_keep]
-
-cycle_model = mcds.data['discrete_cells']['cycle_model']
-cycle_model = cycle_model[idx_keep]
-
-cell_type = mcds.data['discrete_cells']['cell_type']
-cell_type = cell_type[idx_keep]
-
-# onco = mcds.data['discrete_cells']['oncoprotein']
-# onco = onco[idx_keep]
-# onco_min = onco.min()
-# print('onco min, max= ',onco.min(),onco.max())
-# onco_range = onco.max() - onco.min()
 
 print('cell_phase min, max= ',cell_phase.min(),cell_phase.max())  # e.g., 14.0 100.0
 
 # This coloring is only approximately correct, but at least it shows variation in cell colors
-for idx in range(ncells):
-    if cell_type[idx] == 1:
-        rgb[idx,0] = 1
-        rgb[idx,1] = 1
-        rgb[idx,2] = 0
-        # self.yval1 = np.array( [(np.count_nonzero((mcds[idx].data['discrete_cells']['cell_type'] == 1) & (mcds[idx].data['discrete_cells']['cycle_model'] < 100) == True)) for idx in range(ds_count)] )
-    if cycle_model[idx] < 100:
-        # rgb[idx,0] = 0.5
-        # rgb[idx,1] = 0.5
-        # rgb[idx,0] = 1.0 - (onco[idx] - onco_min)/onco_range
-        rgb[idx,0] = 1.0
-        # rgb[idx,1] = (onco[idx] - onco_min)/onco_range
-        # rgb[idx,1] = rgb[idx,0]
-        rgb[idx,1] = 1.0
-        rgb[idx,2] = 0
-    elif cycle_model[idx] == 100:
-        rgb[idx,0] = 1
-        rgb[idx,1] = 0
-        rgb[idx,2] = 0
-    elif cycle_model[idx] > 100:
-        rgb[idx,0] = 0.54   # 139./255
-        rgb[idx,1] = 0.27   # 69./255
-        rgb[idx,2] = 0.075  # 19./255
+rgb = colorize(mcds.data['discrete_cells'], LIVE_DEAD_SCHEME)
 
 #-----------------------------
 scene = window.Scene()
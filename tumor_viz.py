@@ -1,17 +1,11 @@
+from clipping import AxisClipping
 from fury import actor, ui, window
 from pyMCDS_cells import pyMCDS_cells
-from vtk.util import numpy_support
 
 
 import numpy as np
 
 
-def argviz(thr_1, thr_2, centers, axis):
-    cond1 = thr_1 <= centers[:, axis]
-    cond2 = centers[:, axis] <= thr_2
-    return cond1 & cond2
-
-
 def build_label(text, font_size=18, bold=False):
     label = ui.TextBlock2D()
     label.message = text
@@ -28,51 +22,24 @@ def build_label(text, font_size=18, bold=False):
 
 
 def change_clipping_plane_x(slider):
-    global ind_x, xyz
+    global clip
     values = slider._values
     r1, r2 = values
-    ind_x = argviz(r1, r2, xyz, 0)
-    update_opacities()
+    clip.set_range(0, r1, r2)
 
 
 def change_clipping_plane_y(slider):
-    global ind_y, xyz
+    global clip
     values = slider._values
     r1, r2 = values
-    ind_y = argviz(r1, r2, xyz, 1)
-    update_opacities()
+    clip.set_range(1, r1, r2)
 
 
 def change_clipping_plane_z(slider):
-    global ind_z, xyz
+    global clip
     values = slider._values
     r1, r2 = values
-    ind_z = argviz(r1, r2, xyz, 2)
-    update_opacities()
-
-
-def update_opacities(verts_per_sph=50):
-    global ind_x, ind_y, ind_z, spheres_actor
-    mapper = spheres_actor.GetMapper()
-    pnt_data = mapper.GetInput().GetPointData()
-    pnt_arrays = pnt_data.GetNumberOfArrays()
-    colors_array = None
-    for i in range(pnt_arrays):
-        if pnt_data.GetArray(i).GetName() == 'colors':
-            colors_array = pnt_data.GetArray(i)
-    spheres_colors = numpy_support.vtk_to_numpy(colors_array)
-    opacities = []
-    vis = [255] * verts_per_sph
-    inv = [0] * verts_per_sph
-    inds = ind_x & ind_y & ind_z
-    for ind in inds:
-        if ind:
-            opacities.extend(vis)
-        else:
-            opacities.extend(inv)
-    opacities = np.array(opacities)
-    spheres_colors[:, 3] = opacities
-    colors_array.Modified()
+    clip.set_range(2, r1, r2)
 
 
 def win_callback(obj, event):
@@ -133,8 +100,6 @@ if __name__ == '__main__':
 
     thr_x1 = np.percentile(xyz[:, 0], 25)
     thr_x2 = max_xyz[0]
-    global ind_x
-    ind_x = argviz(thr_x1, thr_x2, xyz, 0)
     slider_clipping_plane_label_x = build_label('X Clipping Plane')
     slider_clipping_plane_thrs_x = ui.LineDoubleSlider2D(
         initial_values=(thr_x1, thr_x2), min_value=min_xyz[0],
@@ -142,8 +107,6 @@ if __name__ == '__main__':
 
     thr_y1 = np.percentile(xyz[:, 1], 25)
     thr_y2 = max_xyz[1]
-    global ind_y
-    ind_y = argviz(thr_y1, thr_y2, xyz, 1)
     slider_clipping_plane_label_y = build_label('Y Clipping Plane')
     slider_clipping_plane_thrs_y = ui.LineDoubleSlider2D(
         initial_values=(thr_y1, thr_y2), min_value=min_xyz[1],
@@ -151,14 +114,16 @@ if __name__ == '__main__':
 
     thr_z1 = np.percentile(xyz[:, 2], 25)
     thr_z2 = max_xyz[2]
-    global ind_z
-    ind_z = argviz(thr_z1, thr_z2, xyz, 2)
     slider_clipping_plane_label_z = build_label('Z Clipping Plane')
     slider_clipping_plane_thrs_z = ui.LineDoubleSlider2D(
         initial_values=(thr_z1, thr_z2), min_value=min_xyz[2],
         max_value=max_xyz[2], text_template="{value:.0f}")
 
-    update_opacities()
+    # cells are clipped in the fragment shader, the sliders only set the
+    # ranges
+    global clip
+    clip = AxisClipping([thr_x1, thr_y1, thr_z1], [thr_x2, thr_y2, thr_z2])
+    clip.attach(spheres_actor, xyz)
 
     slider_clipping_plane_thrs_x.on_change = change_clipping_plane_x
     slider_clipping_plane_thrs_y.on_change = change_clipping_plane_y
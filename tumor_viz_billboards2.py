@@ -1,8 +1,10 @@
+from cell_colors import glsl_color_function, get_ramp_ranges, \
+    LIVE_DEAD_SCHEME, ONCOPROTEIN_SCHEME
 from fury import actor, ui, window
-from pyMCDS_cells import pyMCDS_cells
+from fury.shaders import attribute_to_actor, shader_to_actor
+from pyMCDS_timeseries import pyMCDS_timeseries
 
 
-import glob
 import numpy as np
 import os
 import vtk
@@ -10,6 +12,23 @@ import vtk
 
 _PATH_DIR = os.path.abspath(os.path.dirname('__file__'))
 _DATA_DIR = os.path.join(_PATH_DIR, 'data')
+_CELL_COLUMNS = ['ID', 'position', 'total_volume', 'cell_type', 'cycle_model',
+                 'oncoprotein']
+# cells are colored in the fragment shader from these raw cell variables,
+# switching schemes or changing the oncoprotein range only sets uniforms
+_SCHEMES = [('Oncoprotein', ONCOPROTEIN_SCHEME), ('Live/dead', LIVE_DEAD_SCHEME)]
+_CELL_ATTRIBUTES = ['cell_type', 'cycle_model', 'oncoprotein']
+_CELL_COLOR, _RAMPS = glsl_color_function(
+    [scheme for _, scheme in _SCHEMES], _CELL_ATTRIBUTES)
+_PASS_ATTRIBUTES_DEC = \
+    """
+    in vec3 cellAttributes;
+    out vec3 cellAttributesVSOutput;
+    """
+_PASS_ATTRIBUTES_IMPL = \
+    """
+    cellAttributesVSOutput = cellAttributes;
+    """
 _RANGE_CENTERS = \
     """
     uniform vec3 lowRanges;
@@ -22,7 +41,9 @@ _RANGE_CENTERS = \
         bool zValidation = lowRanges.z <= center.z && center.z <= highRanges.z;
         return xValidation || yValidation || zValidation;
     }
-    """
+
+    in vec3 cellAttributesVSOutput;
+    """ + _CELL_COLOR
 _FAKE_SPHERE = \
     """
     if(!isVisible(centerVertexMCVSOutput))
@@ -35,7 +56,8 @@ _FAKE_SPHERE = \
     vec3 direction = normalize(vec3(1., 1., 1.));
     float df_1 = max(0, dot(direction, normalizedPoint));
     float sf_1 = pow(df_1, 24);
-    fragOutput0 = vec4(max(df_1 * color, sf_1 * vec3(1)), 1);
+    vec3 cellRGB = cellColor(cellAttributesVSOutput);
+    fragOutput0 = vec4(max(df_1 * cellRGB, sf_1 * vec3(1)), 1);
     """
 
 
@@ -93,80 +115,89 @@ def change_frame(slider):
     update_frame()
 
 
+def build_cells_actor(centers, attributes, radius):
+    # The color passed to the billboard is not used, the fragment shader
+    # colors every cell from its attributes instead
+    cells_actor = actor.billboard(
+        centers, (1, 1, 1), scales=radius, fs_dec=_RANGE_CENTERS,
+        fs_impl=_FAKE_SPHERE)
+
+    # 4 vertices per billboard
+    attribute_to_actor(cells_actor, np.repeat(attributes, 4, axis=0),
+                       'cellAttributes')
+    shader_to_actor(cells_actor, 'vertex', decl_code=_PASS_ATTRIBUTES_DEC,
+                    impl_code=_PASS_ATTRIBUTES_IMPL)
+
+    cells_mapper = cells_actor.GetMapper()
+    cells_mapper.AddObserver(vtk.vtkCommand.UpdateShaderEvent,
+                             vtk_shader_callback)
+    return cells_actor
+
+
+def change_color_scheme(radio):
+    global idx_scheme
+    idx_scheme = [name for name, _ in _SCHEMES].index(radio.checked_labels[0])
+
+
+def change_onco_range(slider):
+    global ramp_ranges
+    ramp_ranges[0] = tuple(slider._values)
+
+
 def read_data():
-    global idx_xml, xml_files
+    global frame_ranges, idx_xml, series
 
-    mcds = pyMCDS_cells(xml_files[idx_xml], _DATA_DIR)
+    mcds = series[idx_xml]
+    cells = mcds.data['discrete_cells']
 
-    ncells = len(mcds.data['discrete_cells']['ID'])
+    ncells = len(cells['ID'])
 
     centers = np.zeros((ncells, 3))
-    centers[:, 0] = mcds.data['discrete_cells']['position_x']
-    centers[:, 1] = mcds.data['discrete_cells']['position_y']
-    centers[:, 2] = mcds.data['discrete_cells']['position_z']
-
-    colors = np.zeros((ncells, 3))
-    colors[:, 0] = 1
-    colors[:, 1] = 1
-    colors[:, 2] = 0
-
-    cycle_model = mcds.data['discrete_cells']['cycle_model']
-
-    cell_type = mcds.data['discrete_cells']['cell_type']
-
-    onco = mcds.data['discrete_cells']['oncoprotein']
-    onco_min = onco.min()
-    onco_range = onco.max() - onco.min()
-
-    # This coloring is only approximately correct, but at least it shows
-    # variation in cell colors
-    for idx in range(ncells):
-        if cell_type[idx] == 1:
-            colors[idx, 0] = 1
-            colors[idx, 1] = 1
-            colors[idx, 2] = 0
-        if cycle_model[idx] < 100:
-            colors[idx, 0] = 1.0 - (onco[idx] - onco_min) / onco_range
-            colors[idx, 1] = colors[idx, 0]
-            colors[idx, 2] = 0
-        elif cycle_model[idx] == 100:
-            colors[idx, 0] = 1
-            colors[idx, 1] = 0
-            colors[idx, 2] = 0
-        elif cycle_model[idx] > 100:
-            colors[idx, 0] = 0.54  # 139./255
-            colors[idx, 1] = 0.27  # 69./255
-            colors[idx, 2] = 0.075  # 19./255
-
-    radius = mcds.data['discrete_cells']['total_volume'] * .75 / np.pi
+    centers[:, 0] = cells['position_x']
+    centers[:, 1] = cells['position_y']
+    centers[:, 2] = cells['position_z']
+
+    attributes = np.zeros((ncells, len(_CELL_ATTRIBUTES)), dtype=np.float32)
+    for i, name in enumerate(_CELL_ATTRIBUTES):
+        attributes[:, i] = cells[name]
+
+    # the oncoprotein range of the frame, as colorize would use; it only
+    # widens the slider, the range the user set is kept across frames
+    frame_ranges = get_ramp_ranges(_RAMPS, cells)
+
+    radius = cells['total_volume'] * .75 / np.pi
     radius = np.cbrt(radius)
 
-    return centers, colors, radius
+    return centers, attributes, radius
 
 
 def update_frame():
-    global high_perc, high_ranges, low_perc, low_ranges, max_centers, \
-        min_centers, scene, spheres_actor, slider_clipping_plane_thrs_x, \
-        slider_clipping_plane_thrs_y, slider_clipping_plane_thrs_z
+    global frame_ranges, high_perc, high_ranges, low_perc, low_ranges, \
+        max_centers, min_centers, ramp_ranges, scene, spheres_actor, \
+        slider_clipping_plane_thrs_x, slider_clipping_plane_thrs_y, \
+        slider_clipping_plane_thrs_z, slider_onco_range
 
     slider_clipping_plane_thrs_x.on_change = lambda slider: None
     slider_clipping_plane_thrs_y.on_change = lambda slider: None
     slider_clipping_plane_thrs_z.on_change = lambda slider: None
+    slider_onco_range.on_change = lambda slider: None
 
-    centers, colors, radius = read_data()
+    centers, attributes, radius = read_data()
 
     scene.rm(spheres_actor)
 
-    spheres_actor = actor.billboard(
-        centers, colors, scales=radius, fs_dec=_RANGE_CENTERS,
-        fs_impl=_FAKE_SPHERE)
-
-    spheres_mapper = spheres_actor.GetMapper()
-    spheres_mapper.AddObserver(vtk.vtkCommand.UpdateShaderEvent,
-                               vtk_shader_callback)
+    spheres_actor = build_cells_actor(centers, attributes, radius)
 
     scene.add(spheres_actor)
 
+    slider_onco_range.min_value = min(slider_onco_range.min_value,
+                                      frame_ranges[0][0])
+    slider_onco_range.max_value = max(slider_onco_range.max_value,
+                                      frame_ranges[0][1])
+    slider_onco_range.left_disk_value = ramp_ranges[0][0]
+    slider_onco_range.right_disk_value = ramp_ranges[0][1]
+    slider_onco_range.on_change = change_onco_range
+
     min_centers = np.min(centers, axis=0)
     max_centers = np.max(centers, axis=0)
 
@@ -198,10 +229,13 @@ def update_frame():
 
 @vtk.calldata_type(vtk.VTK_OBJECT)
 def vtk_shader_callback(caller, event, calldata=None):
-    global high_ranges, low_ranges
+    global high_ranges, idx_scheme, low_ranges, ramp_ranges
     if calldata is not None:
         calldata.SetUniform3f('lowRanges', low_ranges)
         calldata.SetUniform3f('highRanges', high_ranges)
+        calldata.SetUniformi('cellColorScheme', idx_scheme)
+        for i, ramp_range in enumerate(ramp_ranges):
+            calldata.SetUniform2f('cellColorRange{}'.format(i), ramp_range)
 
 
 def win_callback(obj, event):
@@ -214,24 +248,22 @@ def win_callback(obj, event):
 
 
 if __name__ == '__main__':
-    global high_perc, high_ranges, idx_xml, low_perc, low_ranges, \
-        panel, scene, size, spheres_actor, xml_files
+    global frame_ranges, high_perc, high_ranges, idx_scheme, idx_xml, \
+        low_perc, low_ranges, panel, ramp_ranges, scene, series, size, \
+        spheres_actor
 
-    xml_files = glob.glob(os.path.join(_DATA_DIR, '*.xml'))
+    series = pyMCDS_timeseries(_DATA_DIR, pattern='*.xml',
+                               columns=_CELL_COLUMNS, compact=True)
 
     idx_xml = 0
+    idx_scheme = 0
 
-    centers, colors, radius = read_data()
+    centers, attributes, radius = read_data()
+    ramp_ranges = list(frame_ranges)
 
     scene = window.Scene()
 
-    spheres_actor = actor.billboard(
-        centers, colors, scales=radius, fs_dec=_RANGE_CENTERS,
-        fs_impl=_FAKE_SPHERE)
-
-    spheres_mapper = spheres_actor.GetMapper()
-    spheres_mapper.AddObserver(vtk.vtkCommand.UpdateShaderEvent,
-                               vtk_shader_callback)
+    spheres_actor = build_cells_actor(centers, attributes, radius)
 
     scene.add(spheres_actor)
 
@@ -239,18 +271,22 @@ if __name__ == '__main__':
                                 order_transparent=True)
     show_m.initialize()
 
-    panel = ui.Panel2D((480, 270), position=(-185, 5), color=(1, 1, 1),
+    panel = ui.Panel2D((480, 420), position=(-185, 5), color=(1, 1, 1),
                        opacity=.1, align='right')
 
     slider_frame_label = build_label('Frame')
+    color_scheme_label = build_label('Color Scheme')
+    slider_onco_range_label = build_label('Oncoprotein')
     slider_clipping_plane_label_x = build_label('X Clipping Plane')
     slider_clipping_plane_label_y = build_label('Y Clipping Plane')
     slider_clipping_plane_label_z = build_label('Z Clipping Plane')
 
-    panel.add_element(slider_frame_label, (.04, .85))
-    panel.add_element(slider_clipping_plane_label_x, (.04, .55))
-    panel.add_element(slider_clipping_plane_label_y, (.04, .35))
-    panel.add_element(slider_clipping_plane_label_z, (.04, .15))
+    panel.add_element(slider_frame_label, (.04, .9))
+    panel.add_element(color_scheme_label, (.04, .74))
+    panel.add_element(slider_onco_range_label, (.04, .55))
+    panel.add_element(slider_clipping_plane_label_x, (.04, .36))
+    panel.add_element(slider_clipping_plane_label_y, (.04, .23))
+    panel.add_element(slider_clipping_plane_label_z, (.04, .1))
 
     min_centers = np.min(centers, axis=0)
     max_centers = np.max(centers, axis=0)
@@ -266,10 +302,20 @@ if __name__ == '__main__':
     )
 
     slider_frame_thr = ui.LineSlider2D(
-        initial_value=0, min_value=0, max_value=len(xml_files) - 1, length=260,
+        initial_value=0, min_value=0, max_value=len(series) - 1, length=260,
         line_width=3, outer_radius=8, font_size=16,
         text_template="{value:.0f}")
 
+    color_scheme_radio = ui.RadioButton(
+        [name for name, _ in _SCHEMES], [_SCHEMES[idx_scheme][0]], padding=1,
+        font_size=16, font_family='Arial')
+
+    slider_onco_range = ui.LineDoubleSlider2D(
+        line_width=3, outer_radius=8, length=260,
+        initial_values=ramp_ranges[0], min_value=ramp_ranges[0][0],
+        max_value=ramp_ranges[0][1], font_size=16,
+        text_template="{value:.2f}")
+
     slider_clipping_plane_thrs_x = ui.LineDoubleSlider2D(
         line_width=3, outer_radius=8, length=260,
         initial_values=(low_ranges[0], high_ranges[0]),
@@ -289,14 +335,18 @@ if __name__ == '__main__':
         text_template="{value:.0f}")
 
     slider_frame_thr.on_change = change_frame
+    color_scheme_radio.on_change = change_color_scheme
+    slider_onco_range.on_change = change_onco_range
     slider_clipping_plane_thrs_x.on_change = change_clipping_plane_x
     slider_clipping_plane_thrs_y.on_change = change_clipping_plane_y
     slider_clipping_plane_thrs_z.on_change = change_clipping_plane_z
 
-    panel.add_element(slider_frame_thr, (.38, .85))
-    panel.add_element(slider_clipping_plane_thrs_x, (.38, .55))
-    panel.add_element(slider_clipping_plane_thrs_y, (.38, .35))
-    panel.add_element(slider_clipping_plane_thrs_z, (.38, .15))
+    panel.add_element(slider_frame_thr, (.38, .9))
+    panel.add_element(color_scheme_radio, (.38, .66))
+    panel.add_element(slider_onco_range, (.38, .55))
+    panel.add_element(slider_clipping_plane_thrs_x, (.38, .36))
+    panel.add_element(slider_clipping_plane_thrs_y, (.38, .23))
+    panel.add_element(slider_clipping_plane_thrs_z, (.38, .1))
 
     scene.add(panel)
 